@@ -6,7 +6,8 @@ from config import ACCESS_KEYS
 from keyboards import get_stop_keyboard, get_main_keyboard
 from stats_helpers import send_grouped_stats
 from state import state
-from groups_csv import load_allowed_groups  # импорт нового модуля
+from outbound import reply
+from persistence import persistence_worker
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +17,7 @@ async def start_auth(update: Update, context: CallbackContext) -> int:
     user_id = update.effective_user.id
     chat_id = update.effective_chat.id
     logger.info("Авторизация: Получена команда /start от пользователя %s (chat_id: %s)", user_id, chat_id)
-    await update.message.reply_text(f"""Привет! 👋 Я — бот для мониторинга активности телефонных номеров в Telegram-группах.
+    await reply(update, context, f"""Привет! 👋 Я — бот для мониторинга активности телефонных номеров в Telegram-группах.
 Я собираю статистику о том, когда номера начали и закончили работу, считаю время простоя и создаю отчёты.
 
 📊 Основные возможности:
@@ -43,7 +44,7 @@ async def start_auth(update: Update, context: CallbackContext) -> int:
 Добавьте меня в нужные группы и сбор статистики начнется🚀
 Если возникнут вопросы – обращайтесь @jeasusy 💬
     """)
-    await update.message.reply_text(f"Введите ключ доступа:")
+    await reply(update, context, f"Введите ключ доступа:")
     return ACCESS_KEY_STATE
 
 
@@ -64,7 +65,7 @@ async def process_access_key(update: Update, context: CallbackContext) -> int:
         if csv_filename not in state.admin_chat_ids:
             state.admin_chat_ids[csv_filename] = set()
         if len(state.admin_chat_ids[csv_filename]) >= MAX_ACTIVE_USERS:
-            await update.message.reply_text("Превышено допустимое количество пользователей для этого ключа. Введите другой")
+            await reply(update, context, "Превышено допустимое количество пользователей для этого ключа. Введите другой")
             return ACCESS_KEY_STATE
 
         context.user_data['csv_filename'] = csv_filename
@@ -73,7 +74,7 @@ async def process_access_key(update: Update, context: CallbackContext) -> int:
         state.admin_chat_ids[csv_filename].add(chat_id)
 
         # Загрузка разрешённых групп для данного ключа
-        allowed_groups_all = load_allowed_groups()
+        allowed_groups_all = persistence_worker.load_allowed_groups()
         user_allowed_groups = allowed_groups_all.get(access_key, {})  # {group_id: group_name}
         context.user_data["allowed_groups"] = user_allowed_groups
         state.allowed_groups[csv_filename] = user_allowed_groups
@@ -86,18 +87,21 @@ async def process_access_key(update: Update, context: CallbackContext) -> int:
 
         state.tracking_active = True
         state.stats.clear()
-        state.load_from_csv(csv_filename)
+        state.load(csv_filename)
 
-        await send_grouped_stats(context)
-        await update.message.reply_text(
+        # Ответ на ключ уходит до рассылки отчётов, а не после всех страниц в очереди чата
+        await reply(
+            update,
+            context,
             "Авторизация успешна.\nСтатистика запущена",
             reply_markup=get_main_keyboard()
         )
+        await send_grouped_stats(context)
         logger.info("Авторизация завершена для пользователя %s (chat_id: %s)", user_id, chat_id)
         return ConversationHandler.END
     else:
         logger.warning("Авторизация: Пользователь %s ввёл неверный ключ '%s'", user_id, access_key)
-        await update.message.reply_text("Неверный ключ доступа. Попробуйте ещё раз:")
+        await reply(update, context, "Неверный ключ доступа. Попробуйте ещё раз:")
         return ACCESS_KEY_STATE
 
 
@@ -8,8 +8,79 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
 TIMEZONE = "Europe/Kiev"
 GEMINI_API_KEY_SECONDARY = os.getenv("GEMINI_API_KEY_SECONDARY")
+# Дополнительные ключи Gemini через запятую; вместе с двумя ключами выше образуют пул ключей
+GEMINI_API_KEYS = list(dict.fromkeys(
+    key.strip() for key in [GEMINI_API_KEY, GEMINI_API_KEY_SECONDARY, *os.getenv("GEMINI_API_KEYS", "").split(",")]
+    if key and key.strip()
+))
+# Адрес API Gemini (например, локальная заглушка для проверки квот и ошибок); по умолчанию — облачный
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
 ACCESS_KEYS = {
     "key1": "stats_account1.csv",
     "key2": "stats_account2.csv",
     "key3": "stats_account3.csv"
 }
+# Окно (в секундах), в течение которого изменения статистики копятся перед обновлением сообщений
+STATS_REFRESH_INTERVAL = float(os.getenv("STATS_REFRESH_INTERVAL", "2"))
+# Количество записей в журнале аккаунта, после которого он сворачивается в снимок CSV
+JOURNAL_COMPACT_EVERY = int(os.getenv("JOURNAL_COMPACT_EVERY", "500"))
+# Фоновая запись на диск: интервал сброса (сек) и число изменений, после которого сброс выполняется сразу
+PERSIST_FLUSH_INTERVAL = float(os.getenv("PERSIST_FLUSH_INTERVAL", "1"))
+PERSIST_FLUSH_THRESHOLD = int(os.getenv("PERSIST_FLUSH_THRESHOLD", "50"))
+# Хранилище статистики: "csv" (файл на аккаунт + groups.csv) или "sqlite" (единая база SQLITE_PATH)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "csv")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "stats.db")
+# Кэш результатов извлечения LLM: максимальное число записей и время жизни записи (сек)
+EXTRACTION_CACHE_SIZE = int(os.getenv("EXTRACTION_CACHE_SIZE", "1024"))
+EXTRACTION_CACHE_TTL = float(os.getenv("EXTRACTION_CACHE_TTL", "3600"))
+# Асинхронный клиент Gemini: максимум одновременных запросов и таймаут одного запроса (сек)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "15"))
+# Пакетная отправка сообщений в Gemini: окно сбора (сек, 0 — без пакетов) и максимальный размер пакета
+LLM_BATCH_WINDOW = float(os.getenv("LLM_BATCH_WINDOW", "0.3"))
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "10"))
+# Пул ключей Gemini: начальная и максимальная пауза (сек) для ключа с разомкнутым автоматом
+# и число подряд идущих ошибок, после которого ключ временно исключается
+KEY_BACKOFF_BASE = float(os.getenv("KEY_BACKOFF_BASE", "5"))
+KEY_BACKOFF_MAX = float(os.getenv("KEY_BACKOFF_MAX", "300"))
+KEY_FAILURE_THRESHOLD = int(os.getenv("KEY_FAILURE_THRESHOLD", "3"))
+# Хеджирование запросов к Gemini: если ответ не пришёл за перцентиль задержки (не меньше LLM_HEDGE_MIN_DELAY сек),
+# тот же запрос уходит на другой ключ и побеждает первый валидный ответ. По умолчанию выключено
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "0").lower() in ("1", "true", "yes")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))
+# Параллельная обработка обновлений Telegram: число одновременно работающих обработчиков
+# и сколько обновлений может ждать в очередях тем
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "16"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "256"))
+# Локальная модель извлечения: журнал пар текст -> ответ LLM для обучения, файл модели,
+# порог уверенности, при котором LLM не вызывается, и доля уверенных ответов, которые всё равно
+# сверяются с LLM для оценки совпадения
+EXTRACTION_LOG_PATH = os.getenv("EXTRACTION_LOG_PATH", "extractions.jsonl")
+EXTRACTION_MODEL_PATH = os.getenv("EXTRACTION_MODEL_PATH", "extraction_model.json")
+EXTRACTION_MODEL_THRESHOLD = float(os.getenv("EXTRACTION_MODEL_THRESHOLD", "0.98"))
+EXTRACTION_MODEL_SHADOW_RATE = float(os.getenv("EXTRACTION_MODEL_SHADOW_RATE", "0.05"))
+# Структурированный режим Gemini: правила в system instruction, ответ по JSON-схеме, в запросе только текст и время
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "0").lower() in ("1", "true", "yes")
+# Деградация при перегрузке LLM: сколько извлечений может ожидать ответа и сколько секунд может ждать
+# самое старое, прежде чем новые сообщения начнут разбираться только локально;
+# правки сообщений старше EDIT_MAX_AGE секунд в этом режиме не обрабатываются.
+# Порог возраста выше худшего времени одного запроса (таймаут, переключение на другой ключ, окно пачки),
+# и срабатывает он только при очереди не меньше LLM_BACKLOG_MIN_DEPTH — один медленный запрос не перегрузка
+LLM_BACKLOG_MAX_DEPTH = int(os.getenv("LLM_BACKLOG_MAX_DEPTH", "50"))
+LLM_BACKLOG_MAX_AGE = float(os.getenv("LLM_BACKLOG_MAX_AGE", str(3 * LLM_REQUEST_TIMEOUT)))
+LLM_BACKLOG_MIN_DEPTH = int(os.getenv("LLM_BACKLOG_MIN_DEPTH", "5"))
+EDIT_MAX_AGE = float(os.getenv("EDIT_MAX_AGE", "300"))
+# Максимальная длина страницы сообщения статистики (лимит Telegram — 4096 символов, запас — под предупреждения)
+MESSAGE_PAGE_LIMIT = int(os.getenv("MESSAGE_PAGE_LIMIT", "3800"))
+# Лимиты исходящих сообщений Telegram: сообщений в секунду на чат и на бота, допустимая пачка подряд
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_GLOBAL_BURST = float(os.getenv("OUTBOUND_GLOBAL_BURST", "30"))
+# Сколько раз повторять запрос после RetryAfter
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "5"))
+# Сколько чатов админов и аккаунтов обновлять параллельно
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "8"))
+# Как часто (в секундах) писать в лог сводку счётчиков бота; 0 — не писать
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", "300"))
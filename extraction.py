@@ -0,0 +1,107 @@
+import logging
+import random
+
+from config import (
+    EXTRACTION_CACHE_SIZE, EXTRACTION_CACHE_TTL, EXTRACTION_LOG_PATH, EXTRACTION_MODEL_PATH,
+    EXTRACTION_MODEL_SHADOW_RATE, EXTRACTION_MODEL_THRESHOLD, LLM_BATCH_MAX_SIZE, LLM_BATCH_WINDOW
+)
+from extraction_cache import ExtractionCache
+from extraction_model import ExtractionHarvester, ExtractionModel, can_serve, labels_from_extraction
+from fast_parser import parse_event
+from llm_batcher import ExtractionBatcher
+from llm_service import llm_service
+from load_shedding import load_shedder
+from relevance_filter import is_relevant
+from utils import empty_extraction, finalize_extraction
+
+logger = logging.getLogger(__name__)
+
+# Счётчики того, каким путём было извлечено событие
+extraction_counters: dict[str, int] = {"local": 0, "dropped": 0, "cache": 0, "model": 0, "llm": 0}
+# Совпадение локальной модели с LLM: checked/agreed — все сверенные предсказания,
+# confident_checked/confident_agreed — уверенные предсказания, выборочно отправленные в LLM для контроля
+model_counters: dict[str, int] = {"checked": 0, "agreed": 0, "confident_checked": 0, "confident_agreed": 0}
+extraction_cache = ExtractionCache(EXTRACTION_CACHE_SIZE, EXTRACTION_CACHE_TTL)
+llm_batcher = ExtractionBatcher(llm_service, LLM_BATCH_WINDOW, LLM_BATCH_MAX_SIZE)
+extraction_model = ExtractionModel.load(EXTRACTION_MODEL_PATH)
+extraction_harvester = ExtractionHarvester(EXTRACTION_LOG_PATH)
+
+
+def extraction_stats() -> dict:
+    """
+    Сводка путей извлечения и совпадения локальной модели с LLM: доля сообщений, ушедших в LLM,
+    и доля совпадений среди всех сверенных и среди уверенных (контрольная выборка) предсказаний.
+    """
+    total = sum(extraction_counters.values())
+    checked, confident_checked = model_counters["checked"], model_counters["confident_checked"]
+    return {
+        **extraction_counters,
+        "llm_share": round(extraction_counters["llm"] / total, 3) if total else 0.0,
+        **model_counters,
+        "agreement": round(model_counters["agreed"] / checked, 3) if checked else None,
+        "confident_agreement": round(model_counters["confident_agreed"] / confident_checked, 3) if confident_checked else None,
+    }
+
+
+def _predict(text: str) -> tuple[dict | None, bool]:
+    """Предсказание локальной модели и признак того, что ему можно верить без LLM."""
+    if extraction_model is None or not can_serve(text):
+        return None, False
+    labels, confidence = extraction_model.predict(text)
+    # Номер и пару событий без времён модель не восстанавливает — такие сообщения разбирает LLM
+    confident = (
+        confidence >= EXTRACTION_MODEL_THRESHOLD
+        and not labels["phone"]
+        and not (labels["started"] and labels["stopped"])
+    )
+    return labels, confident
+
+
+async def extract_event(text: str, default_topic_id: int, message_sent_time) -> dict:
+    """
+    Извлекает событие из сообщения: сначала локальным разбором типовых сообщений,
+    затем отсекает явно посторонние сообщения, берёт ответ из кэша LLM или у локальной модели,
+    если она уверена, и только остальные сообщения отправляет в Gemini.
+    """
+    local = parse_event(text, default_topic_id, message_sent_time)
+    if local is not None:
+        extraction_counters["local"] += 1
+        logger.info(f"Сообщение разобрано локально без LLM: {text}")
+        return local
+    if not is_relevant(text):
+        extraction_counters["dropped"] += 1
+        logger.info(f"Сообщение не похоже на событие, LLM не вызывается: {text}")
+        return empty_extraction(default_topic_id)
+    cached = extraction_cache.get(text)
+    if cached is not None:
+        extraction_counters["cache"] += 1
+        logger.info(f"Ответ LLM взят из кэша: {text}")
+        return finalize_extraction(cached, default_topic_id, message_sent_time)
+    predicted, confident = _predict(text)
+    # В режиме деградации уверенное предсказание не отправляется на контрольную сверку с LLM
+    if confident and (random.random() >= EXTRACTION_MODEL_SHADOW_RATE or load_shedder.should_shed()):
+        extraction_counters["model"] += 1
+        logger.info(f"Сообщение разобрано локальной моделью без LLM: {text} {predicted}")
+        model_extraction = {**empty_extraction(None), "started": predicted["started"], "stopped": predicted["stopped"]}
+        return finalize_extraction(model_extraction, default_topic_id, message_sent_time)
+    if load_shedder.should_shed():
+        logger.warning(f"Режим деградации: сообщение не отправлено в LLM: {text}")
+        return empty_extraction(default_topic_id)
+    extraction_counters["llm"] += 1
+    token = load_shedder.begin()
+    try:
+        extracted = await llm_batcher.request_extraction(text, message_sent_time)
+    finally:
+        load_shedder.end(token)
+    if extracted is None:
+        return empty_extraction(default_topic_id)
+    extraction_harvester.record(text, extracted)
+    if predicted is not None:
+        agreed = predicted == labels_from_extraction(extracted)
+        model_counters["checked"] += 1
+        model_counters["agreed"] += agreed
+        if confident:
+            model_counters["confident_checked"] += 1
+            model_counters["confident_agreed"] += agreed
+    extraction_cache.put(text, extracted)
+    return finalize_extraction(extracted, default_topic_id, message_sent_time)
@@ -0,0 +1,73 @@
+import logging
+import re
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CACHED_FIELDS = ("phone", "started", "stopped", "started_time", "stopped_time", "topic_id")
+
+
+def normalize_text(text: str) -> str:
+    """Ключ кэша: текст без регистра, лишних пробелов и концевой пунктуации."""
+    text = text.lower().replace("ё", "е")
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" .,!")
+
+
+# Время в тексте в любой записи: 12:00, 12.00, 12 00, 1200, 930
+TEXT_TIME_RE = re.compile(r"(?<!\d)(\d{1,2})[\s:.^/,]?(\d{2})(?!\d)")
+
+
+def _is_explicit_time(value: str | None, text: str) -> bool:
+    """Время считается явным, только если его цифры указаны в тексте сообщения."""
+    if not value:
+        return False
+    return any(
+        f"{int(match.group(1)):02d}:{match.group(2)}" == value
+        for match in TEXT_TIME_RE.finditer(text)
+    )
+
+
+class ExtractionCache:
+    """
+    Ограниченный LRU-кэш с TTL для нормализованных ответов LLM.
+    Хранит только поля, не зависящие от времени отправки: номер, флаги событий,
+    явно указанные времена и тему. Времена по умолчанию пересчитываются при каждом попадании
+    (см. utils.finalize_extraction).
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    def get(self, text: str) -> dict | None:
+        key = normalize_text(text)
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(entry[1])
+
+    def put(self, text: str, extracted: dict) -> None:
+        if self.maxsize <= 0:
+            return
+        value = {field: extracted.get(field) for field in CACHED_FIELDS}
+        for field in ("started_time", "stopped_time"):
+            if not _is_explicit_time(value[field], text):
+                value[field] = None
+        key = normalize_text(text)
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
@@ -0,0 +1,196 @@
+import json
+import logging
+import math
+import random
+import sys
+import zlib
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from queue import SimpleQueue
+
+from config import EXTRACTION_LOG_PATH, EXTRACTION_MODEL_PATH
+from extraction_cache import normalize_text
+from fast_parser import TIME_RE, TOPIC_ID_RE
+
+logger = logging.getLogger(__name__)
+
+LABELS = ("started", "stopped", "phone")
+# Размер пространства признаков: n-граммы хешируются в HASH_DIM корзин
+HASH_DIM = 1 << 18
+NGRAM_SIZES = (2, 3, 4)
+
+
+def features(text: str) -> list[int]:
+    """Хешированные символьные n-граммы и слова нормализованного текста (устойчиво к опечаткам)."""
+    text = normalize_text(text)
+    padded = f" {text} "
+    grams = [padded[i:i + n] for n in NGRAM_SIZES for i in range(len(padded) - n + 1)]
+    grams += [f"w:{word}" for word in text.split()]
+    # crc32, а не hash(): хеш строк в Python меняется от запуска к запуску
+    return sorted({zlib.crc32(gram.encode("utf-8")) % HASH_DIM for gram in grams})
+
+
+def _sigmoid(value: float) -> float:
+    if value < -30:
+        return 0.0
+    if value > 30:
+        return 1.0
+    return 1 / (1 + math.exp(-value))
+
+
+class ExtractionModel:
+    """
+    Лёгкая модель на CPU: по одной логистической регрессии на хешированных n-граммах
+    для признаков started, stopped и наличия номера. Обучается на парах текст -> ответ LLM.
+    """
+
+    def __init__(self, heads: dict[str, dict] | None = None):
+        # label -> {"bias": float, "weights": {index: weight}}
+        self.heads = heads or {label: {"bias": 0.0, "weights": {}} for label in LABELS}
+
+    def probabilities(self, text: str) -> dict[str, float]:
+        indexes = features(text)
+        result = {}
+        for label, head in self.heads.items():
+            weights = head["weights"]
+            result[label] = _sigmoid(head["bias"] + sum(weights.get(index, 0.0) for index in indexes))
+        return result
+
+    def predict(self, text: str) -> tuple[dict[str, bool], float]:
+        """Предсказанные флаги и уверенность — минимальная по всем признакам."""
+        probabilities = self.probabilities(text)
+        labels = {label: p >= 0.5 for label, p in probabilities.items()}
+        confidence = min(max(p, 1 - p) for p in probabilities.values())
+        return labels, confidence
+
+    def fit(self, samples: list[tuple[str, dict[str, bool]]], epochs: int = 8, rate: float = 0.3, l2: float = 1e-5) -> None:
+        """Стохастический градиентный спуск по логистической функции потерь."""
+        encoded = [(features(text), labels) for text, labels in samples]
+        rng = random.Random(0)
+        for epoch in range(epochs):
+            rng.shuffle(encoded)
+            step = rate / (1 + epoch)
+            for indexes, labels in encoded:
+                for label, head in self.heads.items():
+                    weights = head["weights"]
+                    score = head["bias"] + sum(weights.get(index, 0.0) for index in indexes)
+                    gradient = _sigmoid(score) - float(labels[label])
+                    head["bias"] -= step * gradient
+                    for index in indexes:
+                        weight = weights.get(index, 0.0)
+                        weights[index] = weight - step * (gradient + l2 * weight)
+
+    def save(self, path: str) -> None:
+        data = {
+            label: {"bias": head["bias"], "weights": {str(k): round(v, 5) for k, v in head["weights"].items() if abs(v) > 1e-4}}
+            for label, head in self.heads.items()
+        }
+        Path(path).write_text(json.dumps(data), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: str) -> "ExtractionModel | None":
+        if not Path(path).exists():
+            return None
+        try:
+            data = json.loads(Path(path).read_text(encoding="utf-8"))
+            return cls({
+                label: {"bias": head["bias"], "weights": {int(k): v for k, v in head["weights"].items()}}
+                for label, head in data.items()
+            })
+        except Exception as e:
+            logger.error("Не удалось загрузить модель извлечения %s: %s", path, e)
+            return None
+
+
+def can_serve(text: str) -> bool:
+    """Модель не восстанавливает времена и тему, поэтому сообщения с ними всегда уходят в LLM."""
+    lowered = text.lower()
+    return not TIME_RE.search(lowered) and not TOPIC_ID_RE.search(lowered)
+
+
+def labels_from_extraction(extracted: dict) -> dict[str, bool]:
+    return {
+        "started": bool(extracted.get("started")),
+        "stopped": bool(extracted.get("stopped")),
+        "phone": extracted.get("phone") is not None,
+    }
+
+
+class ExtractionHarvester:
+    """
+    Записывает пары текст -> ответ LLM в JSON Lines для обучения модели.
+    Запись в файл идёт в отдельном потоке через QueueHandler, обработчик сообщений не ждёт диск.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._logger = logging.getLogger("extraction_harvest")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._queue: SimpleQueue = SimpleQueue()
+        self._listener: QueueListener | None = None
+
+    def start(self) -> None:
+        if self._listener is not None:
+            return
+        file_handler = logging.FileHandler(self.path, encoding="utf-8")
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        self._listener = QueueListener(self._queue, file_handler)
+        self._logger.addHandler(QueueHandler(self._queue))
+        self._listener.start()
+
+    def stop(self) -> None:
+        if self._listener is None:
+            return
+        self._listener.stop()
+        for handler in list(self._logger.handlers):
+            self._logger.removeHandler(handler)
+        for handler in self._listener.handlers:
+            handler.close()
+        self._listener = None
+
+    def record(self, text: str, extracted: dict) -> None:
+        if self._listener is None:
+            return
+        self._logger.info(json.dumps({"text": text, **labels_from_extraction(extracted)}, ensure_ascii=False))
+
+
+def load_samples(path: str) -> list[tuple[str, dict[str, bool]]]:
+    samples = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # Повторы одного текста не должны перевешивать остальные примеры
+            samples[normalize_text(entry["text"])] = {label: bool(entry.get(label)) for label in LABELS}
+    return list(samples.items())
+
+
+def train(log_path: str = EXTRACTION_LOG_PATH, model_path: str = EXTRACTION_MODEL_PATH) -> None:
+    samples = load_samples(log_path)
+    if not samples:
+        print(f"Нет примеров в {log_path}")
+        return
+    rng = random.Random(1)
+    rng.shuffle(samples)
+    split = max(1, len(samples) // 5)
+    holdout, training = samples[:split], samples[split:] or samples
+    model = ExtractionModel()
+    model.fit(training)
+    agreed = sum(1 for text, labels in holdout if model.predict(text)[0] == labels)
+    print(f"Примеров: {len(samples)}, совпадение с LLM на отложенной выборке: {agreed}/{len(holdout)}")
+    # Итоговая модель обучается заново на всех примерах
+    model = ExtractionModel()
+    model.fit(samples)
+    model.save(model_path)
+    print(f"Модель сохранена в {model_path}")
+
+
+if __name__ == "__main__":
+    # python extraction_model.py train [журнал] [модель] — обучить модель на собранных ответах LLM
+    if sys.argv[1:2] == ["train"]:
+        train(*sys.argv[2:4])
+    else:
+        print("Использование: python extraction_model.py train [extractions.jsonl] [extraction_model.json]")
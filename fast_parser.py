@@ -0,0 +1,175 @@
+import logging
+import re
+
+from utils import adjust_times
+
+logger = logging.getLogger(__name__)
+
+# Словарь событий из подсказки для LLM (utils.py) вместе с частыми опечатками и транслитом
+STARTED_WORDS = {
+    "встал", "встала", "встали", "стоит", "работает", "зашел", "зашла", "зашли", "вошел",
+    "вслат", "вствл", "всатл", "стлоит", "сашел", "зашол", "вхлд", "вход",
+    "vstal", "zashel", "stoit", "rabotaet",
+}
+STOPPED_WORDS = {
+    "слетел", "слетела", "слетели", "слет", "умер", "умерла", "сдох",
+    "стел", "стелел", "слетл", "слтел", "сетел", "слеткл", "слнтел",
+    "slet", "sletel", "umer",
+}
+# Слова, не меняющие смысла сообщения ("встал в 12:00")
+FILLER_WORDS = {"в", "во"}
+
+# Номер: группы цифр, разделённые пробелами, дефисами или скобками ("+7 (999) 123-45-67")
+PHONE_RE = re.compile(r"\+?\d+(?:[\s\-()]{1,3}\d+)*")
+DIGITS_RE = re.compile(r"\d+")
+TOPIC_ID_RE = re.compile(r"id:\s*(\d+)")
+# Время с опечатками: 12:00, 12.00, 12^00, 12/00, 12,00, 12 00, 1200, 9:30.
+# Трёхзначное "123" не считается временем: такое сообщение разбирает LLM
+TIME_RE = re.compile(r"(?<!\d)(?:([01]\d|2[0-3])\s?[:.^/,]?\s?|(\d)[:.^/,]\s?)([0-5]\d)(?!\d)")
+# Время с явным разделителем никогда не бывает частью номера
+EXPLICIT_TIME_RE = re.compile(r"(?<!\d)\d{1,2}[:.^/,]\s?\d{2}(?!\d)")
+TOKEN_RE = re.compile(r"#?[^\W\d_]+\.?|[+\-]|\S")
+
+
+def _edge_time(text: str, groups: list[tuple[int, int]], at_end: bool) -> tuple[int, bool]:
+    """
+    Сколько крайних групп цифр похожи на время ("1200", "12 00", "123"), отделённое от остальных пробелом,
+    и является ли оно допустимым временем. (0, False) — на краю нет ничего похожего на время.
+    """
+    for count in (1, 2):
+        if len(groups) <= count:
+            break
+        edge = groups[-count:] if at_end else groups[:count]
+        lengths = [end - start for start, end in edge]
+        if count == 1 and lengths[0] not in (3, 4):
+            continue
+        if count == 2 and not (lengths[0] <= 2 and lengths[1] == 2):
+            continue
+        # Время отделено от номера пробелом, а не дефисом или скобкой
+        separator = text[groups[-count - 1][1]:edge[0][0]] if at_end else text[edge[-1][1]:groups[count][0]]
+        if not any(char.isspace() for char in separator):
+            continue
+        return count, TIME_RE.fullmatch(text[edge[0][0]:edge[-1][1]]) is not None
+    return 0, False
+
+
+def _extract_phone(text: str) -> tuple[str | None, str | None]:
+    """
+    Номер и текст без него. Номер не захватывает соседнее время ("встал 1200 79990001122"),
+    а если крайнюю группу цифр нельзя однозначно отнести ни к номеру, ни ко времени,
+    возвращает (None, None) — сообщение разбирает LLM.
+    """
+    masked = EXPLICIT_TIME_RE.sub(lambda m: "x" * len(m.group(0)), text)
+    for match in PHONE_RE.finditer(masked):
+        groups = [(m.start() + match.start(), m.end() + match.start()) for m in DIGITS_RE.finditer(match.group(0))]
+        for at_end in (True, False):
+            count, is_time = _edge_time(text, groups, at_end)
+            rest = groups[:-count] if at_end else groups[count:]
+            if count and sum(end - start for start, end in rest) > 8:
+                if not is_time:
+                    return None, None
+                groups = rest
+        digits = "".join(text[start:end] for start, end in groups)
+        # Так же, как в message_handler: номер — это больше 8 цифр
+        if 8 < len(digits) <= 15:
+            start = groups[0][0]
+            if start > 0 and text[start - 1] == "+":
+                start -= 1
+            return digits, text[:start] + " " + text[groups[-1][1]:]
+    return None, text
+
+
+def _tokenize(text: str) -> list[tuple[str, str | None]] | None:
+    """
+    Разбивает текст на маркеры: ("start", None), ("stop", None), ("plus"/"minus", None), ("time", "HH:MM").
+    Возвращает None, если встречено неизвестное слово — такое сообщение разбирает LLM.
+    """
+    tokens = []
+    pos = 0
+    for time_match in TIME_RE.finditer(text):
+        if not _tokenize_words(text[pos:time_match.start()], tokens):
+            return None
+        hour = time_match.group(1) or time_match.group(2)
+        tokens.append(("time", f"{int(hour):02d}:{time_match.group(3)}"))
+        pos = time_match.end()
+    if not _tokenize_words(text[pos:], tokens):
+        return None
+    return tokens
+
+
+def _tokenize_words(chunk: str, tokens: list) -> bool:
+    for word in TOKEN_RE.findall(chunk):
+        word = word.rstrip(".")
+        if word == "+":
+            tokens.append(("plus", None))
+        elif word == "-":
+            tokens.append(("minus", None))
+        elif word in ("#слет", "#слёт"):
+            tokens.append(("stop", None))
+        elif word in STARTED_WORDS:
+            tokens.append(("start", None))
+        elif word in STOPPED_WORDS:
+            tokens.append(("stop", None))
+        elif word in FILLER_WORDS or word in ("", ",", ":", "!", "."):
+            continue
+        else:
+            return False
+    return True
+
+
+def parse_event(text: str, default_topic_id: int, message_sent_time) -> dict | None:
+    """
+    Локальный разбор типовых сообщений ("встал 1122", "+ 1150 - 1155", "слет", "#СЛЕТ 12.40", номер).
+    Возвращает словарь того же вида, что и extraction.extract_event, или None, если сообщение
+    неоднозначно и его нужно отдать LLM.
+    """
+    lowered = text.lower().replace("ё", "е").strip()
+    if not lowered or "?" in lowered:
+        return None
+    topic_id_match = TOPIC_ID_RE.search(lowered)
+    if topic_id_match:
+        lowered = lowered[:topic_id_match.start()] + " " + lowered[topic_id_match.end():]
+    phone, rest = _extract_phone(lowered)
+    if rest is None:
+        return None
+    tokens = _tokenize(rest)
+    if tokens is None:
+        return None
+
+    events = []  # [kind, time]
+    for kind, value in tokens:
+        if kind == "time":
+            # Время относится к ближайшему предыдущему событию без времени
+            if not events or events[-1][1] is not None:
+                return None
+            events[-1][1] = value
+        elif kind == "minus" and events and events[-1][0] in ("start", "stop") and events[-1][1] is None:
+            # "встал - 21:00": дефис после слова-события — разделитель, а не "слетел"
+            continue
+        else:
+            events.append([kind, None])
+
+    # Голые "+"/"-" без времени событием не считаются
+    started_events = [e for e in events if e[0] == "start" or (e[0] == "plus" and e[1])]
+    stopped_events = [e for e in events if e[0] == "stop" or (e[0] == "minus" and e[1])]
+    if len(started_events) > 1 or len(stopped_events) > 1:
+        return None
+    started = bool(started_events)
+    stopped = bool(stopped_events)
+    started_time = started_events[0][1] if started else None
+    stopped_time = stopped_events[0][1] if stopped else None
+    # "встал и сразу слетел" LLM трактует как отсутствие событий — без явных времён не угадываем
+    if started and stopped and (started_time is None or stopped_time is None):
+        return None
+    if not started and not stopped and phone is None and not events:
+        return None
+
+    new_started, new_stopped = adjust_times(started, stopped, started_time, stopped_time, message_sent_time)
+    return {
+        "phone": phone,
+        "started": started,
+        "stopped": stopped,
+        "started_time": new_started,
+        "stopped_time": new_stopped,
+        "topic_id": int(topic_id_match.group(1)) if topic_id_match else default_topic_id,
+    }
@@ -2,6 +2,8 @@ import csv
 from pathlib import Path
 import logging
 
+from utils_helpers import atomic_open
+
 logger = logging.getLogger(__name__)
 
 GROUPS_CSV = "groups.csv"
@@ -31,12 +33,12 @@ def load_allowed_groups() -> dict:
         logger.error("Ошибка загрузки разрешённых групп: %s", e)
     return allowed_groups
 
-def save_allowed_groups(allowed_groups: dict) -> None:
+def save_allowed_groups(allowed_groups: dict) -> bool:
     """
-    Сохраняет данные о разрешённых группах в CSV-файл.
+    Сохраняет данные о разрешённых группах в CSV-файл (через временный файл и переименование).
     """
     try:
-        with open(GROUPS_CSV, "w", newline="", encoding="utf-8") as f:
+        with atomic_open(GROUPS_CSV, newline="") as f:
             fieldnames = ["access_key", "group_id", "group_name"]
             writer = csv.DictWriter(f, fieldnames=fieldnames)
             writer.writeheader()
@@ -44,5 +46,7 @@ def save_allowed_groups(allowed_groups: dict) -> None:
                 for group_id, group_name in groups.items():
                     writer.writerow({"access_key": key, "group_id": group_id, "group_name": group_name})
         logger.info("Разрешённые группы успешно сохранены.")
+        return True
     except Exception as e:
         logger.error("Ошибка сохранения разрешённых групп: %s", e)
+        return False
@@ -0,0 +1,101 @@
+import json
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class StatsJournal:
+    """
+    Append-only журнал изменений статистики одного аккаунта в формате JSON Lines.
+    Каждая строка — одна мутация записи ("start" или "stop") с полным состоянием записи,
+    поэтому повторное применение журнала поверх снимка CSV идемпотентно.
+    Новые записи копятся в памяти и дописываются на диск фоновым потоком (см. persistence.py).
+    """
+
+    def __init__(self, csv_filename: str):
+        self.path = Path(f"{csv_filename}.journal")
+        self._lock = threading.Lock()
+        self._pending: list[dict] = []
+        self._written: int | None = None
+
+    @property
+    def size(self) -> int:
+        """Количество записей в журнале (на диске и в буфере) с момента последнего снимка."""
+        with self._lock:
+            if self._written is None:
+                self._written = len(self.read()) if self.path.exists() else 0
+            return self._written + len(self._pending)
+
+    def append(self, entry: dict) -> None:
+        with self._lock:
+            self._pending.append(entry)
+
+    def take_pending(self) -> list[dict]:
+        """Забирает записи из буфера. Используется перед снимком, который их уже включает."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            return pending
+
+    def restore(self, entries: list[dict]) -> None:
+        """Возвращает записи в начало буфера, чтобы не потерять их до следующей попытки."""
+        with self._lock:
+            self._pending[:0] = entries
+
+    def flush(self, entries: list[dict] | None = None) -> None:
+        """Дописывает на диск буфер (или переданные записи)."""
+        if entries is None:
+            entries = self.take_pending()
+        if not entries:
+            return
+        try:
+            lines = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+            with self._lock:
+                self._written = (self._written or 0) + len(entries)
+        except Exception as e:
+            logger.error("Ошибка записи в журнал %s: %s", self.path, e)
+            self.restore(entries)
+
+    def read(self) -> list[dict]:
+        if not self.path.exists():
+            return []
+        entries = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Последняя строка могла быть недописана при аварийной остановке
+                    logger.warning("Пропущена повреждённая строка журнала %s", self.path)
+        return entries
+
+    def all_entries(self) -> list[dict]:
+        """Записи на диске вместе с ещё не записанным буфером."""
+        entries = self.read()
+        with self._lock:
+            entries.extend(self._pending)
+        return entries
+
+    def truncate(self) -> None:
+        try:
+            if self.path.exists():
+                open(self.path, "w", encoding="utf-8").close()
+            with self._lock:
+                self._written = 0
+        except Exception as e:
+            logger.error("Ошибка очистки журнала %s: %s", self.path, e)
+
+
+_journals: dict[str, StatsJournal] = {}
+
+
+def get_journal(csv_filename: str) -> StatsJournal:
+    if csv_filename not in _journals:
+        _journals[csv_filename] = StatsJournal(csv_filename)
+    return _journals[csv_filename]
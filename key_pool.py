@@ -0,0 +1,151 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Доля веса нового наблюдения в скользящих средних ошибок и задержки
+EWMA_ALPHA = 0.2
+
+
+def is_quota_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return "429" in message or "resource_exhausted" in message or "quota" in message or "rate limit" in message
+
+
+class KeyHealth:
+    __slots__ = (
+        "key", "state", "error_rate", "latency", "consecutive_failures",
+        "open_until", "backoff", "probe_in_flight", "probe_started", "successes", "failures", "quota_errors"
+    )
+
+    def __init__(self, key: str):
+        self.key = key
+        self.state = CLOSED
+        self.error_rate = 0.0
+        self.latency = 0.0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.backoff = 0.0
+        # Пробный запрос зарезервирован вызывающим (candidates) и уже отправлен (begin)
+        self.probe_in_flight = False
+        self.probe_started = False
+        self.successes = 0
+        self.failures = 0
+        self.quota_errors = 0
+
+    def score(self) -> float:
+        # Меньше — лучше: частые ошибки весят сильнее, чем лишняя секунда задержки
+        return self.error_rate * 10 + self.latency
+
+
+class GeminiKeyPool:
+    """
+    Пул ключей Gemini с учётом их состояния. Для каждого ключа хранит скользящие
+    доли ошибок и задержку, число ошибок квоты (429) и автомат (circuit breaker):
+    после ошибки квоты или failure_threshold ошибок подряд ключ исключается на время
+    backoff с экспоненциальным ростом, затем пропускает один пробный запрос (half-open).
+    """
+
+    def __init__(self, keys: list[str], backoff_base: float, backoff_max: float, failure_threshold: int):
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self._health: dict[str, KeyHealth] = {key: KeyHealth(key) for key in keys}
+
+    @property
+    def keys(self) -> list[str]:
+        return list(self._health)
+
+    def candidates(self) -> list[str]:
+        """
+        Ключи в порядке попыток. Восстанавливающийся ключ получает один пробный запрос первым
+        (иначе при живых ключах его никто не проверит), затем идут рабочие ключи от самых здоровых.
+        Пробный запрос резервируется здесь же, чтобы параллельные вызовы не отправили второй;
+        неиспользованный резерв вызывающий возвращает через release_unused.
+        """
+        now = time.monotonic()
+        healthy = []
+        probes = []
+        for health in self._health.values():
+            if health.state == OPEN and now >= health.open_until:
+                health.state = HALF_OPEN
+                health.probe_in_flight = False
+                health.probe_started = False
+                logger.info("Ключ Gemini %s: пробный запрос после паузы", _mask(health.key))
+            if health.state == CLOSED:
+                healthy.append(health)
+            elif health.state == HALF_OPEN and not health.probe_in_flight:
+                health.probe_in_flight = True
+                health.probe_started = False
+                probes.append(health)
+        healthy.sort(key=KeyHealth.score)
+        return [health.key for health in probes] + [health.key for health in healthy]
+
+    def begin(self, key: str) -> None:
+        health = self._health[key]
+        if health.state == HALF_OPEN:
+            health.probe_in_flight = True
+            health.probe_started = True
+
+    def release(self, key: str) -> None:
+        """Запрос отменён (например, проигравший хедж): на состояние ключа это не влияет."""
+        health = self._health[key]
+        health.probe_in_flight = False
+        health.probe_started = False
+
+    def release_unused(self, keys: list[str]) -> None:
+        """Снимает резерв пробных запросов с ключей из candidates(), до которых дело не дошло."""
+        for key in keys:
+            health = self._health[key]
+            if health.state == HALF_OPEN and health.probe_in_flight and not health.probe_started:
+                health.probe_in_flight = False
+
+    def report_success(self, key: str, latency: float) -> None:
+        health = self._health[key]
+        health.successes += 1
+        health.consecutive_failures = 0
+        health.error_rate *= 1 - EWMA_ALPHA
+        health.latency = latency if health.latency == 0 else health.latency + EWMA_ALPHA * (latency - health.latency)
+        if health.state != CLOSED:
+            logger.info("Ключ Gemini %s снова доступен", _mask(key))
+        health.state = CLOSED
+        health.backoff = 0.0
+        health.probe_in_flight = False
+        health.probe_started = False
+
+    def report_failure(self, key: str, error: Exception) -> None:
+        health = self._health[key]
+        health.failures += 1
+        health.consecutive_failures += 1
+        health.error_rate += EWMA_ALPHA * (1 - health.error_rate)
+        quota = is_quota_error(error)
+        if quota:
+            health.quota_errors += 1
+        if quota or health.state == HALF_OPEN or health.consecutive_failures >= self.failure_threshold:
+            self._open(health)
+        health.probe_in_flight = False
+        health.probe_started = False
+
+    def _open(self, health: KeyHealth) -> None:
+        health.backoff = min(self.backoff_max, health.backoff * 2 if health.backoff else self.backoff_base)
+        health.open_until = time.monotonic() + health.backoff
+        health.state = OPEN
+        logger.warning("Ключ Gemini %s исключён на %.0f с", _mask(health.key), health.backoff)
+
+    def snapshot(self) -> list[dict]:
+        return [
+            {
+                "key": _mask(h.key), "state": h.state, "error_rate": round(h.error_rate, 3),
+                "latency": round(h.latency, 3), "successes": h.successes, "failures": h.failures,
+                "quota_errors": h.quota_errors,
+            }
+            for h in self._health.values()
+        ]
+
+
+def _mask(key: str) -> str:
+    return f"...{key[-4:]}" if key else "-"
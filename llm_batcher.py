@@ -0,0 +1,83 @@
+import asyncio
+import logging
+
+from llm_service import GeminiExtractionService
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionBatcher:
+    """
+    Собирает сообщения для Gemini в пакеты: ждёт window секунд после первого сообщения
+    (или пока не наберётся max_size), отправляет пакет одним запросом и раздаёт ответы
+    ожидающим обработчикам. Так длинная инструкция и сетевой запрос делятся на весь пакет.
+    """
+
+    def __init__(self, service: GeminiExtractionService, window: float, max_size: int):
+        self.service = service
+        self.window = window
+        self.max_size = max_size
+        self._pending: list[tuple[str, object, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.counters: dict[str, int] = {"batches": 0, "batched_messages": 0, "fallbacks": 0}
+
+    async def request_extraction(self, text: str, message_sent_time) -> dict | None:
+        if self.window <= 0 or self.max_size <= 1:
+            return await self.service.request_extraction(text, message_sent_time)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, message_sent_time, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        # Держим ссылку на задачу, чтобы её не собрал сборщик мусора
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: list[tuple[str, object, asyncio.Future]]) -> None:
+        try:
+            if len(batch) == 1:
+                text, message_sent_time, future = batch[0]
+                result = await self.service.request_extraction(text, message_sent_time)
+                if not future.done():
+                    future.set_result(result)
+                return
+            self.counters["batches"] += 1
+            self.counters["batched_messages"] += len(batch)
+            results = await self.service.request_batch([(text, sent) for text, sent, _ in batch])
+            if results is None:
+                # Ни один ключ не ответил — поштучные запросы во время сбоя только умножат нагрузку
+                logger.warning("Пакет из %s сообщений не обработан: все ключи Gemini недоступны", len(batch))
+                results = {}
+                missing = []
+            else:
+                missing = [(index, item) for index, item in enumerate(batch) if index not in results]
+            if missing:
+                # Сообщения, для которых модель не вернула ответ, переспрашиваем по одному
+                self.counters["fallbacks"] += len(missing)
+                logger.warning("В пакетном ответе нет %s из %s сообщений, запрашиваем их по одному", len(missing), len(batch))
+                singles = await asyncio.gather(
+                    *(self.service.request_extraction(text, sent) for _, (text, sent, _) in missing)
+                )
+                for (index, _), result in zip(missing, singles):
+                    results[index] = result
+            for index, (_, _, future) in enumerate(batch):
+                if not future.done():
+                    future.set_result(results.get(index))
+        except Exception as e:
+            logger.error("Ошибка при обработке пакета сообщений для LLM: %s", e)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_result(None)
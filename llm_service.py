@@ -0,0 +1,274 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable
+
+from google import genai
+from google.genai import types
+
+from config import (
+    GEMINI_API_KEYS, GEMINI_BASE_URL, GEMINI_MODEL, KEY_BACKOFF_BASE, KEY_BACKOFF_MAX, KEY_FAILURE_THRESHOLD,
+    LLM_HEDGE_MIN_DELAY, LLM_HEDGE_PERCENTILE, LLM_HEDGING_ENABLED, LLM_MAX_CONCURRENCY, LLM_REQUEST_TIMEOUT,
+    LLM_STRUCTURED_OUTPUT
+)
+from key_pool import GeminiKeyPool
+from utils import (
+    BATCH_EXTRACTION_SCHEMA, BATCH_SYSTEM_INSTRUCTION, EXTRACTION_SCHEMA, STRUCTURED_SYSTEM_INSTRUCTION,
+    build_batch_prompt, build_compact_batch_content, build_compact_content, build_prompt, normalize_extraction,
+    parse_llm_batch_output, parse_llm_output, parse_structured_batch_output, parse_structured_output
+)
+
+logger = logging.getLogger(__name__)
+
+STRUCTURED_CONFIG = types.GenerateContentConfig(
+    system_instruction=STRUCTURED_SYSTEM_INSTRUCTION,
+    response_mime_type="application/json",
+    response_schema=EXTRACTION_SCHEMA,
+)
+STRUCTURED_BATCH_CONFIG = types.GenerateContentConfig(
+    system_instruction=BATCH_SYSTEM_INSTRUCTION,
+    response_mime_type="application/json",
+    response_schema=BATCH_EXTRACTION_SCHEMA,
+)
+
+# Сколько последних задержек учитывать при расчёте перцентиля для хеджирования
+LATENCY_SAMPLES = 200
+
+
+class GeminiExtractionService:
+    """
+    Асинхронный сервис запросов к Gemini. Создаётся один раз при старте и держит
+    по одному долгоживущему клиенту на ключ (с переиспользуемыми HTTPS-соединениями).
+    Число одновременных запросов ограничено семафором, каждый запрос — таймаутом.
+    Ключ для запроса выбирает пул ключей по их текущему состоянию.
+
+    При включённом хеджировании запрос, не ответивший за заданный перцентиль задержки,
+    дублируется на следующем ключе: побеждает первый валидный ответ, второй запрос отменяется.
+
+    В структурированном режиме правила передаются как system instruction, формат ответа — схемой JSON,
+    а в запросе остаются только текст и время отправки.
+    """
+
+    def __init__(
+        self,
+        key_pool: GeminiKeyPool,
+        model: str,
+        max_concurrency: int,
+        request_timeout: float,
+        base_url: str | None = None,
+        hedging: bool = False,
+        hedge_percentile: float = 95,
+        hedge_min_delay: float = 1,
+        structured: bool = False
+    ):
+        self.key_pool = key_pool
+        self.model = model
+        self.request_timeout = request_timeout
+        self.base_url = base_url
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._clients: dict[str, genai.Client] = {}
+        self.structured = structured
+        self.hedging = hedging
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self._latencies: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        # requests — запросы к сервису, fired — отправленные дубликаты (каждый — лишний платный запрос),
+        # won — дубликат ответил первым, cancelled — проигравший запрос отменён до ответа
+        self.hedge_counters: dict[str, int] = {"requests": 0, "fired": 0, "won": 0, "cancelled": 0}
+
+    def _client(self, key: str) -> genai.Client:
+        if key not in self._clients:
+            http_options = types.HttpOptions(base_url=self.base_url) if self.base_url else None
+            self._clients[key] = genai.Client(api_key=key, http_options=http_options)
+        return self._clients[key]
+
+    def start(self) -> None:
+        for key in self.key_pool.keys:
+            self._client(key)
+        logger.info("Сервис Gemini запущен: ключей %s, модель %s", len(self.key_pool.keys), self.model)
+
+    async def close(self) -> None:
+        for client in self._clients.values():
+            try:
+                await client.aio.aclose()
+            except Exception as e:
+                logger.error("Ошибка при закрытии клиента Gemini: %s", e)
+        self._clients.clear()
+
+    async def generate(
+        self,
+        key: str,
+        prompt: str,
+        config: types.GenerateContentConfig | None = None,
+        sent: asyncio.Event | None = None
+    ) -> str:
+        """Запрос к Gemini; sent выставляется, когда запрос получил место в семафоре и ушёл к API."""
+        async with self._semaphore:
+            self.key_pool.begin(key)
+            if sent is not None:
+                sent.set()
+            started = time.monotonic()
+            try:
+                response = await asyncio.wait_for(
+                    self._client(key).aio.models.generate_content(model=self.model, contents=prompt, config=config),
+                    timeout=self.request_timeout
+                )
+            except asyncio.CancelledError:
+                self.key_pool.release(key)
+                raise
+            except Exception as e:
+                self.key_pool.report_failure(key, e)
+                raise
+            latency = time.monotonic() - started
+            self.key_pool.report_success(key, latency)
+            self._latencies.append(latency)
+        return response.text
+
+    def hedge_delay(self) -> float:
+        """Задержка, после которой отправляется дубликат: перцентиль последних задержек, но не меньше минимума."""
+        if len(self._latencies) < 10:
+            return max(self.hedge_min_delay, self.request_timeout / 2)
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))
+        return max(self.hedge_min_delay, ordered[index])
+
+    def hedge_stats(self) -> dict:
+        """Счётчики хеджирования и его цена — доля лишних запросов."""
+        requests = self.hedge_counters["requests"]
+        return {**self.hedge_counters, "extra_cost": self.hedge_counters["fired"] / requests if requests else 0.0}
+
+    async def _attempt(
+        self,
+        key: str,
+        prompt: str,
+        parse: Callable[[str], object],
+        config: types.GenerateContentConfig | None = None,
+        sent: asyncio.Event | None = None
+    ):
+        try:
+            return parse(await self.generate(key, prompt, config, sent))
+        except Exception as e:
+            logger.error(f"Ошибка при запросе с ключом ...{key[-4:]}: {e!r}")
+            return None
+
+    async def _hedged(
+        self,
+        primary: str,
+        backup: str,
+        prompt: str,
+        parse: Callable[[str], object],
+        config: types.GenerateContentConfig | None = None
+    ):
+        sent = asyncio.Event()
+        tasks = [asyncio.create_task(self._attempt(primary, prompt, parse, config, sent))]
+        try:
+            # Отсчёт до дубликата начинается, когда запрос ушёл к API: ожидание в локальной очереди
+            # семафора не делает запрос медленным и не должно порождать лишние платные запросы
+            sent_waiter = asyncio.create_task(sent.wait())
+            try:
+                await asyncio.wait([tasks[0], sent_waiter], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                sent_waiter.cancel()
+            delay = self.hedge_delay()
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self._semaphore.locked():
+                # Свободных мест нет: дубликат только встанет в ту же очередь и удвоит нагрузку
+                done, _ = await asyncio.wait(tasks)
+            if done:
+                # Первый ключ ответил вовремя или быстро упал — второй ключ используем как обычный запасной
+                result = tasks[0].result()
+                return result if result is not None else await self._attempt(backup, prompt, parse, config)
+            self.hedge_counters["fired"] += 1
+            logger.info("Gemini не ответил за %.2f с, дублируем запрос на ключ ...%s", delay, backup[-4:])
+            tasks.append(asyncio.create_task(self._attempt(backup, prompt, parse, config)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result is None:
+                        continue
+                    if task is tasks[1]:
+                        self.hedge_counters["won"] += 1
+                    self.hedge_counters["cancelled"] += len(pending)
+                    return result
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _generate_with_failover(
+        self,
+        prompt: str,
+        parse: Callable[[str], object],
+        config: types.GenerateContentConfig | None = None
+    ):
+        self.hedge_counters["requests"] += 1
+        reserved = self.key_pool.candidates()
+        candidates = reserved
+        if not candidates:
+            logger.warning("Все ключи Gemini временно исключены, запрос не отправлен")
+        try:
+            while candidates:
+                if self.hedging and len(candidates) >= 2:
+                    primary, backup = candidates[0], candidates[1]
+                    result = await self._hedged(primary, backup, prompt, parse, config)
+                    if result is not None:
+                        return result
+                    candidates = candidates[2:]
+                else:
+                    result = await self._attempt(candidates[0], prompt, parse, config)
+                    if result is not None:
+                        return result
+                    candidates = candidates[1:]
+                if candidates:
+                    logger.info("Попытка использовать следующий Gemini API ключ")
+            return None
+        finally:
+            # Пробные запросы, зарезервированные за этим вызовом, но не отправленные, достаются другим
+            self.key_pool.release_unused(reserved)
+
+    async def request_extraction(self, text: str, message_sent_time) -> dict | None:
+        """Запрашивает Gemini и возвращает нормализованный ответ или None, если ни один ключ не сработал."""
+        logger.info(f"Сообщение для LLM: {text} {message_sent_time}")
+        if self.structured:
+            return await self._generate_with_failover(
+                build_compact_content(text, message_sent_time),
+                lambda output_text: normalize_extraction(parse_structured_output(output_text), text),
+                STRUCTURED_CONFIG
+            )
+        return await self._generate_with_failover(
+            build_prompt(text, message_sent_time),
+            lambda output_text: normalize_extraction(parse_llm_output(output_text), text)
+        )
+
+    async def request_batch(self, items: list[tuple[str, object]]) -> dict[int, dict] | None:
+        """
+        Отправляет пакет (text, message_sent_time) одним запросом.
+        Возвращает нормализованные ответы по индексу сообщения или None, если ни один ключ не сработал.
+        """
+        logger.info(f"Пакет сообщений для LLM: {len(items)}")
+        parse_items = parse_structured_batch_output if self.structured else parse_llm_batch_output
+
+        def parse(output_text: str) -> dict[int, dict]:
+            return {
+                index: normalize_extraction(item, items[index][0])
+                for index, item in parse_items(output_text).items() if 0 <= index < len(items)
+            }
+
+        if self.structured:
+            return await self._generate_with_failover(build_compact_batch_content(items), parse, STRUCTURED_BATCH_CONFIG)
+        return await self._generate_with_failover(build_batch_prompt(items), parse)
+
+llm_service = GeminiExtractionService(
+    GeminiKeyPool(GEMINI_API_KEYS, KEY_BACKOFF_BASE, KEY_BACKOFF_MAX, KEY_FAILURE_THRESHOLD),
+    GEMINI_MODEL,
+    LLM_MAX_CONCURRENCY,
+    LLM_REQUEST_TIMEOUT,
+    GEMINI_BASE_URL,
+    LLM_HEDGING_ENABLED,
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_MIN_DELAY,
+    LLM_STRUCTURED_OUTPUT
+)
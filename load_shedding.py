@@ -0,0 +1,106 @@
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from config import EDIT_MAX_AGE, LLM_BACKLOG_MAX_AGE, LLM_BACKLOG_MAX_DEPTH, LLM_BACKLOG_MIN_DEPTH
+
+logger = logging.getLogger(__name__)
+
+DEGRADED_BANNER = "⚠️ Gemini перегружен: новые сообщения разбираются только локально, часть событий может не попасть в статистику."
+# Сколько последних сообщений помнить для отсева повторных правок
+SEEN_MESSAGES = 4096
+
+
+class LoadShedder:
+    """
+    Следит за очередью запросов к LLM. Если ожидающих извлечений больше max_depth или самое старое
+    ждёт дольше max_age секунд при очереди не меньше min_depth, бот переходит в режим деградации: новые сообщения разбираются только
+    локально (fast_parser, кэш, локальная модель), устаревшие правки сообщений отбрасываются,
+    а админы видят предупреждение в сообщении статистики. Режим снимается, когда очередь
+    сокращается вдвое, чтобы не переключаться туда-обратно на каждом сообщении.
+    """
+
+    def __init__(self, max_depth: int, max_age: float, edit_max_age: float, min_depth: int = 1):
+        self.max_depth = max_depth
+        self.max_age = max_age
+        self.min_depth = min_depth
+        self.edit_max_age = edit_max_age
+        self.degraded = False
+        self._changed = False
+        self._tokens = itertools.count()
+        # Токен запроса -> время его начала (time.monotonic)
+        self._pending: dict[int, float] = {}
+        # (chat_id, message_id) -> последний обработанный текст
+        self._seen: OrderedDict[tuple[int, int], str] = OrderedDict()
+        self.counters: dict[str, int] = {"shed": 0, "edits_dropped": 0, "degraded_periods": 0}
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def oldest_age(self) -> float:
+        if not self._pending:
+            return 0.0
+        return time.monotonic() - min(self._pending.values())
+
+    def begin(self) -> int:
+        token = next(self._tokens)
+        self._pending[token] = time.monotonic()
+        return token
+
+    def end(self, token: int) -> None:
+        self._pending.pop(token, None)
+        self._update()
+
+    def _update(self) -> None:
+        depth, age = self.depth, self.oldest_age()
+        stalled = depth >= self.min_depth and age >= self.max_age
+        if not self.degraded and (depth >= self.max_depth or stalled):
+            self.degraded = True
+            self._changed = True
+            self.counters["degraded_periods"] += 1
+            logger.warning("Очередь LLM: %s запросов, старейший ждёт %.0f с — включён режим деградации", depth, age)
+        elif self.degraded and depth <= self.max_depth // 2 and (depth < self.min_depth or age < self.max_age / 2):
+            self.degraded = False
+            self._changed = True
+            logger.info("Очередь LLM разгружена, режим деградации снят")
+
+    def should_shed(self) -> bool:
+        """Нужно ли разобрать сообщение без LLM."""
+        self._update()
+        if self.degraded:
+            self.counters["shed"] += 1
+        return self.degraded
+
+    def take_transition(self) -> bool:
+        """True один раз после каждого входа в режим деградации или выхода из него."""
+        changed, self._changed = self._changed, False
+        return changed
+
+    def banner(self) -> str | None:
+        return DEGRADED_BANNER if self.degraded else None
+
+    def accept_message(self, chat_id: int, message_id: int, text: str, edited: bool, sent_at: datetime) -> bool:
+        """
+        Отсеивает правки, которые не нужно обрабатывать: с тем же текстом, что уже обработан,
+        и (в режиме деградации) правки сообщений старше edit_max_age секунд.
+        """
+        key = (chat_id, message_id)
+        previous = self._seen.get(key)
+        if edited and previous == text:
+            self.counters["edits_dropped"] += 1
+            return False
+        if edited and self.degraded and (datetime.now(timezone.utc) - sent_at).total_seconds() > self.edit_max_age:
+            self.counters["edits_dropped"] += 1
+            logger.info("Режим деградации: пропущена устаревшая правка сообщения %s в чате %s", message_id, chat_id)
+            return False
+        self._seen[key] = text
+        self._seen.move_to_end(key)
+        if len(self._seen) > SEEN_MESSAGES:
+            self._seen.popitem(last=False)
+        return True
+
+
+load_shedder = LoadShedder(LLM_BACKLOG_MAX_DEPTH, LLM_BACKLOG_MAX_AGE, EDIT_MAX_AGE, LLM_BACKLOG_MIN_DEPTH)
@@ -6,14 +6,43 @@ from telegram.ext import Application, CommandHandler, CallbackQueryHandler, Mess
 from auth import login_conv_handler
 from stats_helpers import stop_tracking, button_handler, message_handler, relaunch_stat
 from groups_commands import list_groups, add_group_handler, remove_group_handler
-from config import TELEGRAM_BOT_TOKEN
+from config import TELEGRAM_BOT_TOKEN, UPDATE_QUEUE_SIZE, UPDATE_WORKERS
+from extraction import extraction_harvester
+from llm_service import llm_service
+from metrics import metrics_reporter
+from outbound import outbound_sender
+from persistence import persistence_worker
+from update_pipeline import TopicOrderedUpdateProcessor
 
 nest_asyncio.apply()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+async def on_startup(app: Application) -> None:
+    persistence_worker.start()
+    llm_service.start()
+    extraction_harvester.start()
+    outbound_sender.start()
+    metrics_reporter.start()
+
+async def on_shutdown(app: Application) -> None:
+    # Дописываем на диск всё, что поток записи ещё не успел сохранить
+    persistence_worker.stop()
+    await outbound_sender.close()
+    await metrics_reporter.close()
+    await llm_service.close()
+    extraction_harvester.stop()
+
 async def main() -> None:
-    app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    app = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        # Темы обрабатываются параллельно, сообщения внутри темы — по порядку
+        .concurrent_updates(TopicOrderedUpdateProcessor(UPDATE_WORKERS, UPDATE_QUEUE_SIZE))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
 
     # Сначала регистрируем обработчики команд
     app.add_handler(login_conv_handler)
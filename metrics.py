@@ -0,0 +1,73 @@
+import asyncio
+import json
+import logging
+from typing import Callable
+
+from config import METRICS_LOG_INTERVAL
+from extraction import extraction_cache, extraction_stats, llm_batcher
+from llm_service import llm_service
+from load_shedding import load_shedder
+from outbound import outbound_sender
+from report_renderer import report_renderer
+from state import state
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsReporter:
+    """
+    Раз в interval секунд пишет в лог одну строку со счётчиками всех компонентов бота,
+    чтобы по логам можно было следить за долей LLM, совпадением модели и остальными метриками.
+    """
+
+    def __init__(self, interval: float, sources: dict[str, Callable[[], dict]]):
+        self.interval = interval
+        self.sources = sources
+        self._task: asyncio.Task | None = None
+
+    def snapshot(self) -> dict[str, dict]:
+        result = {}
+        for name, source in self.sources.items():
+            try:
+                result[name] = source()
+            except Exception as e:
+                logger.error("Не удалось получить метрики %s: %s", name, e)
+        return result
+
+    def report(self) -> None:
+        logger.info("Метрики: %s", json.dumps(self.snapshot(), ensure_ascii=False))
+
+    def start(self) -> None:
+        if self.interval <= 0 or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Итоговая сводка за время работы
+        self.report()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self.report()
+
+
+metrics_reporter = MetricsReporter(METRICS_LOG_INTERVAL, {
+    # Пути извлечения, включая отсечённые фильтром релевантности сообщения (dropped)
+    "extraction": extraction_stats,
+    "cache": extraction_cache.stats,
+    "batches": lambda: dict(llm_batcher.counters),
+    "hedging": llm_service.hedge_stats,
+    "keys": lambda: {"keys": llm_service.key_pool.snapshot()},
+    "shedding": lambda: {**load_shedder.counters, "degraded": load_shedder.degraded, "depth": load_shedder.depth},
+    "edits": lambda: dict(state.edit_counters),
+    "renderer": lambda: dict(report_renderer.counters),
+    "outbound": lambda: {**outbound_sender.counters, "queued": outbound_sender.depth},
+})
@@ -0,0 +1,267 @@
+import asyncio
+import itertools
+import logging
+import time
+from datetime import timedelta
+
+from telegram import Bot, Update
+from telegram.error import RetryAfter
+from telegram.ext import CallbackContext
+
+from config import (
+    OUTBOUND_CHAT_BURST,
+    OUTBOUND_CHAT_RATE,
+    OUTBOUND_GLOBAL_BURST,
+    OUTBOUND_GLOBAL_RATE,
+    OUTBOUND_MAX_RETRIES,
+)
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих сообщений: меньше — раньше
+PRIORITY_COMMAND = 0
+PRIORITY_REPORT = 1
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше burst подряд."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        # До какого момента Telegram просил не отправлять (retry_after)
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд появится токен (0 — можно отправлять сейчас)."""
+        self._refill(now)
+        blocked = self.blocked_until - now
+        missing = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        return max(blocked, missing, 0.0)
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+class OutboundJob:
+    __slots__ = ("priority", "seq", "chat_id", "method", "kwargs", "waiters", "attempts")
+
+    def __init__(self, priority: int, seq: int, chat_id: int, method: str, kwargs: dict):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.method = method
+        self.kwargs = kwargs
+        self.waiters: list[asyncio.Future] = []
+        self.attempts = 0
+
+    def sort_key(self) -> tuple[int, int]:
+        return self.priority, self.seq
+
+
+class OutboundSender:
+    """
+    Очередь исходящих запросов к Telegram с учётом лимитов: примерно 1 сообщение в секунду
+    на чат и 30 в секунду на бота. Ответы на команды идут раньше обновлений статистики,
+    запросы одного чата выполняются по порядку, а при RetryAfter чат ставится на паузу
+    на указанное время и запрос повторяется. Несколько ожидающих правок одного сообщения
+    схлопываются в последнюю: отправляется только самое свежее содержимое.
+    """
+
+    def __init__(self, chat_rate: float, chat_burst: float, global_rate: float, global_burst: float, max_retries: int):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats: dict[int, TokenBucket] = {}
+        self._jobs: list[OutboundJob] = []
+        # (chat_id, message_id) -> ожидающая правка этого сообщения
+        self._pending_edits: dict[tuple[int, int], OutboundJob] = {}
+        self._in_flight: set[int] = set()
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        # Выполняющиеся запросы: держим ссылки, чтобы задачи не собрал сборщик мусора
+        self._requests: set[asyncio.Task] = set()
+        self._bot: Bot | None = None
+        self.counters: dict[str, int] = {"sent": 0, "collapsed": 0, "retried": 0, "failed": 0}
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            # Событие привязывается к циклу событий, в котором работает очередь
+            self._wakeup = asyncio.Event()
+            self._in_flight.clear()
+            if self._jobs:
+                self._wakeup.set()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        requests = list(self._requests)
+        for task in requests:
+            task.cancel()
+        # Отменённый запрос сам отменяет своих ожидающих
+        await asyncio.gather(*requests, return_exceptions=True)
+        for job in self._jobs:
+            for waiter in job.waiters:
+                if not waiter.done():
+                    waiter.cancel()
+        self._jobs.clear()
+        self._pending_edits.clear()
+
+    @property
+    def depth(self) -> int:
+        return len(self._jobs)
+
+    async def send_message(self, bot: Bot, chat_id: int, priority: int = PRIORITY_REPORT, **kwargs):
+        return await self._enqueue(bot, chat_id, "send_message", priority, {"chat_id": chat_id, **kwargs})
+
+    async def edit_message_text(self, bot: Bot, chat_id: int, message_id: int, priority: int = PRIORITY_REPORT, **kwargs):
+        key = (chat_id, message_id)
+        job = self._pending_edits.get(key)
+        if job is not None:
+            # Правка ещё не ушла — заменяем её содержимое более свежим
+            job.kwargs = {"chat_id": chat_id, "message_id": message_id, **kwargs}
+            job.priority = min(job.priority, priority)
+            waiter = asyncio.get_running_loop().create_future()
+            job.waiters.append(waiter)
+            self.counters["collapsed"] += 1
+            return await waiter
+        return await self._enqueue(
+            bot, chat_id, "edit_message_text", priority, {"chat_id": chat_id, "message_id": message_id, **kwargs}, key
+        )
+
+    async def delete_message(self, bot: Bot, chat_id: int, message_id: int, priority: int = PRIORITY_REPORT):
+        return await self._enqueue(bot, chat_id, "delete_message", priority, {"chat_id": chat_id, "message_id": message_id})
+
+    async def _enqueue(self, bot: Bot, chat_id: int, method: str, priority: int, kwargs: dict, edit_key: tuple | None = None):
+        self._bot = bot
+        self.start()
+        job = OutboundJob(priority, next(self._seq), chat_id, method, kwargs)
+        waiter = asyncio.get_running_loop().create_future()
+        job.waiters.append(waiter)
+        self._jobs.append(job)
+        if edit_key is not None:
+            self._pending_edits[edit_key] = job
+        self._wakeup.set()
+        return await waiter
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _next_job(self) -> tuple[OutboundJob | None, float | None]:
+        """Самый приоритетный запрос, который можно отправить сейчас, или время ожидания до ближайшего."""
+        now = time.monotonic()
+        global_wait = self._global.wait_time(now)
+        delay = None
+        seen_chats = set()
+        for job in sorted(self._jobs, key=OutboundJob.sort_key):
+            # Запросы одного чата уходят по порядку: за чат отвечает только его первый запрос
+            if job.chat_id in seen_chats or job.chat_id in self._in_flight:
+                seen_chats.add(job.chat_id)
+                continue
+            seen_chats.add(job.chat_id)
+            wait = max(global_wait, self._bucket(job.chat_id).wait_time(now))
+            if wait == 0:
+                return job, None
+            delay = wait if delay is None else min(delay, wait)
+        return None, delay
+
+    async def _run(self) -> None:
+        while True:
+            job, delay = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._jobs.remove(job)
+            self._global.take()
+            self._bucket(job.chat_id).take()
+            self._in_flight.add(job.chat_id)
+            if job.method == "edit_message_text":
+                self._pending_edits.pop((job.chat_id, job.kwargs["message_id"]), None)
+            # Сам запрос идёт отдельной задачей, чтобы медленный ответ не задерживал другие чаты
+            task = asyncio.get_running_loop().create_task(self._execute(job))
+            self._requests.add(task)
+            task.add_done_callback(self._requests.discard)
+
+    async def _execute(self, job: OutboundJob) -> None:
+        try:
+            result = await getattr(self._bot, job.method)(**job.kwargs)
+        except RetryAfter as e:
+            job.attempts += 1
+            retry_after = e.retry_after
+            seconds = retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+            bucket = self._bucket(job.chat_id)
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + seconds)
+            if job.attempts <= self.max_retries:
+                self.counters["retried"] += 1
+                logger.warning("Лимит Telegram для чата %s: повтор %s через %.0f с", job.chat_id, job.method, seconds)
+                self._requeue(job)
+            else:
+                self._fail(job, e)
+        except asyncio.CancelledError:
+            for waiter in job.waiters:
+                if not waiter.done():
+                    waiter.cancel()
+            raise
+        except Exception as e:
+            self._fail(job, e)
+        else:
+            self.counters["sent"] += 1
+            for waiter in job.waiters:
+                if not waiter.done():
+                    waiter.set_result(result)
+        finally:
+            self._in_flight.discard(job.chat_id)
+            self._wakeup.set()
+
+    def _requeue(self, job: OutboundJob) -> None:
+        if job.method == "edit_message_text":
+            key = (job.chat_id, job.kwargs["message_id"])
+            newer = self._pending_edits.get(key)
+            if newer is not None:
+                # Пока ждали, пришла более свежая правка — повторять старое содержимое не нужно
+                newer.waiters.extend(job.waiters)
+                return
+            self._pending_edits[key] = job
+        self._jobs.append(job)
+
+    def _fail(self, job: OutboundJob, error: Exception) -> None:
+        self.counters["failed"] += 1
+        for waiter in job.waiters:
+            if not waiter.done():
+                waiter.set_exception(error)
+
+
+outbound_sender = OutboundSender(
+    OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST, OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_BURST, OUTBOUND_MAX_RETRIES
+)
+
+
+async def reply(update: Update, context: CallbackContext, text: str, **kwargs) -> None:
+    """Ответ на команду, кнопку или сообщение в диалоге через очередь — раньше обновлений статистики."""
+    message = update.message or (update.callback_query.message if update.callback_query else None)
+    if message is None:
+        return
+    await outbound_sender.send_message(context.bot, message.chat_id, PRIORITY_COMMAND, text=text, **kwargs)
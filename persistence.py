@@ -0,0 +1,92 @@
+import copy
+import logging
+import threading
+
+from config import PERSIST_FLUSH_INTERVAL, PERSIST_FLUSH_THRESHOLD
+from state import state
+from storage import storage
+
+logger = logging.getLogger(__name__)
+
+
+class PersistenceWorker:
+    """
+    Отложенная запись на диск (write-behind).
+    Обработчики только помечают аккаунты как изменённые, а отдельный поток раз в interval
+    секунд (или сразу после threshold изменений) пачкой сбрасывает журналы, снимки CSV
+    и список разрешённых групп. Так задержка обработчиков не зависит от размера файлов и диска.
+    """
+
+    def __init__(self, interval: float, threshold: int):
+        self.interval = interval
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        # csv_filename -> нужно ли свернуть журнал в снимок
+        self._dirty_accounts: dict[str, bool] = {}
+        self._dirty_count = 0
+        self._allowed_groups: dict | None = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="persistence-worker", daemon=True)
+        self._thread.start()
+        logger.info("Поток записи на диск запущен (интервал %s с, порог %s изменений)", self.interval, self.threshold)
+
+    def stop(self) -> None:
+        """Останавливает поток и синхронно сбрасывает всё, что ещё не записано."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        logger.info("Поток записи на диск остановлен, все изменения сохранены")
+
+    def mark_dirty(self, csv_filename: str, compact: bool = False) -> None:
+        with self._lock:
+            self._dirty_accounts[csv_filename] = self._dirty_accounts.get(csv_filename, False) or compact
+            self._dirty_count += 1
+            if compact or self._dirty_count >= self.threshold:
+                self._wakeup.set()
+
+    def schedule_allowed_groups(self, allowed_groups: dict) -> None:
+        with self._lock:
+            self._allowed_groups = copy.deepcopy(allowed_groups)
+            self._wakeup.set()
+
+    def load_allowed_groups(self) -> dict:
+        """Разрешённые группы с учётом ещё не записанных изменений."""
+        with self._lock:
+            if self._allowed_groups is not None:
+                return copy.deepcopy(self._allowed_groups)
+        return storage.load_allowed_groups()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            dirty_accounts, self._dirty_accounts = self._dirty_accounts, {}
+            self._dirty_count = 0
+            allowed_groups = self._allowed_groups
+        for csv_filename, compact in dirty_accounts.items():
+            try:
+                state.flush_account(csv_filename, compact=compact)
+            except Exception as e:
+                logger.error("Ошибка фоновой записи статистики %s: %s", csv_filename, e)
+        if allowed_groups is not None and storage.save_allowed_groups(allowed_groups):
+            with self._lock:
+                # Сбрасываем отложенную копию, только если её не успели заменить новой
+                if self._allowed_groups is allowed_groups:
+                    self._allowed_groups = None
+
+
+persistence_worker = PersistenceWorker(PERSIST_FLUSH_INTERVAL, PERSIST_FLUSH_THRESHOLD)
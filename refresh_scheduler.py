@@ -0,0 +1,57 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from telegram.ext import CallbackContext
+
+from utils_helpers import fan_out
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshScheduler:
+    """
+    Планировщик обновления сообщений статистики.
+    Помечает изменённые группы (csv_filename, group_id) как "грязные", копит изменения
+    в течение окна interval и затем один раз обновляет каждую грязную группу.
+    Группы (в том числе одна группа в разных аккаунтах из group_to_keys) обновляются
+    параллельно, не больше concurrency одновременно.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        refresh_group: Callable[[str, int, CallbackContext], Awaitable[None]],
+        concurrency: int = 1
+    ):
+        self.interval = interval
+        self.concurrency = concurrency
+        self._refresh_group = refresh_group
+        self._dirty: set[tuple[str, int]] = set()
+        self._context: CallbackContext | None = None
+        self._task: asyncio.Task | None = None
+
+    def mark_dirty(self, csv_filename: str, group_id: int, context: CallbackContext) -> None:
+        self._dirty.add((csv_filename, group_id))
+        self._context = context
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        # Пока за время обновления появляются новые изменения, выжидаем следующее окно
+        while self._dirty:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        logger.info("Обновление статистики для %s групп", len(dirty))
+        context = self._context
+        await fan_out(
+            dirty,
+            lambda target: self._refresh_group(target[0], target[1], context),
+            self.concurrency,
+            "обновления статистики группы"
+        )
@@ -0,0 +1,156 @@
+import json
+import logging
+import re
+import sys
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+
+from config import EXTRACTION_LOG_PATH
+from fast_parser import STARTED_WORDS, STOPPED_WORDS
+
+logger = logging.getLogger(__name__)
+
+# Словарь событий из подсказки для LLM (utils.py) и разбора fast_parser, плюс слова,
+# которые LLM тоже трактует как события или вопросы о них ("минус?", "вылет", "упал", "отвалился")
+EVENT_WORDS = STARTED_WORDS | STOPPED_WORDS | {
+    "плюс", "минус", "вылет", "вошла", "вошли", "упал", "отвал", "забан", "бан", "заблок", "блок",
+    "поставил", "запустил", "подключ", "отключ", "живой", "мертв",
+}
+# Слова короче этого порога сравниваются только точно: иначе "да", "он" совпадут с чем угодно
+MIN_WORD_LENGTH = 3
+# Известная болтовня: сообщение отсекается, только если все его слова отсюда.
+# Любое незнакомое слово отправляет сообщение дальше — фильтр не должен терять новые формулировки событий
+BASE_CHATTER_WORDS = {
+    "привет", "всем", "здравствуйте", "доброе", "добрый", "утро", "день", "вечер", "ночи", "спокойной",
+    "спасибо", "благодарю", "пожалуйста", "ок", "окей", "ok", "ага", "угу", "да", "нет", "ну",
+    "понял", "поняла", "поняли", "принял", "приняла", "хорошо", "ладно", "понятно", "ясно", "все", "всё",
+    "кто", "что", "когда", "где", "как", "почему", "зачем", "сегодня", "завтра", "вчера", "сейчас",
+    "на", "в", "во", "с", "со", "и", "а", "но", "у", "меня", "мне", "я", "ты", "вы", "мы", "он", "она",
+    "смене", "смена", "будет", "оплата", "оплату", "скиньте", "скинь", "номер", "номера", "новый",
+    "ошибка", "жду", "ждем", "посмотрю", "посмотрим", "не", "грузит", "ахахах", "хаха", "ахах",
+}
+# Слово считается болтовнёй по журналу ответов LLM, если встретилось столько раз и только в сообщениях без событий
+LEARNED_CHATTER_MIN_COUNT = 3
+
+WORD_RE = re.compile(r"[^\W\d_]+")
+# Цифры (время, номер, "id: 2") и знаки +/- — такие сообщения всегда отдаём дальше
+SIGNAL_RE = re.compile(r"[\d+\-#]")
+
+
+def load_labelled_log(path: str) -> list[tuple[str, bool]]:
+    """Пары (текст, есть ли событие или номер по ответу LLM) из журнала ExtractionHarvester."""
+    if not Path(path).exists():
+        return []
+    samples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            samples.append((entry["text"], bool(entry.get("started") or entry.get("stopped") or entry.get("phone"))))
+    return samples
+
+
+def learn_chatter(samples: list[tuple[str, bool]], min_count: int = LEARNED_CHATTER_MIN_COUNT) -> set[str]:
+    """Слова, которые LLM видел не меньше min_count раз и ни разу в сообщении с событием."""
+    chatter_counts: Counter = Counter()
+    event_words: set[str] = set()
+    for text, relevant in samples:
+        words = set(WORD_RE.findall(text.lower().replace("ё", "е")))
+        if relevant:
+            event_words |= words
+        else:
+            chatter_counts.update(words)
+    return {
+        word for word, count in chatter_counts.items()
+        if count >= min_count and word not in event_words and not is_event_word(word)
+    }
+
+
+def _distance_limit(length: int) -> int:
+    return 1 if length <= 4 else 2
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Расстояние Дамерау-Левенштейна (с перестановкой соседних букв) с ранним выходом после limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: list[int] = []
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+@lru_cache(maxsize=4096)
+def is_event_word(word: str) -> bool:
+    """Слово похоже на событие: совпадает со словарём с опечаткой или является его формой ("слетела")."""
+    if len(word) < MIN_WORD_LENGTH:
+        return False
+    for event_word in EVENT_WORDS:
+        if word.startswith(event_word):
+            return True
+        if _edit_distance(word, event_word, _distance_limit(len(event_word))) <= _distance_limit(len(event_word)):
+            return True
+    return False
+
+
+def is_relevant(text: str, chatter_words: set[str] | None = None) -> bool:
+    """
+    Быстрая проверка, может ли сообщение описывать событие. Отсекает только сообщения из одной
+    известной болтовни (приветствия, вопросы, благодарности) или вовсе без слов: всё с цифрами,
+    знаками +/-/#, словом, похожим на словарь событий, или любым незнакомым словом считается релевантным.
+    """
+    lowered = text.lower().replace("ё", "е")
+    if SIGNAL_RE.search(lowered):
+        return True
+    words = WORD_RE.findall(lowered)
+    if any(is_event_word(word) for word in words):
+        return True
+    chatter_words = CHATTER_WORDS if chatter_words is None else chatter_words
+    return any(word not in chatter_words for word in words)
+
+
+def evaluate(samples: list[tuple[str, bool]], chatter_words: set[str] | None = None) -> dict:
+    """
+    Прогоняет фильтр по размеченным сообщениям. missed — события, которые фильтр отбросил бы
+    (должно быть 0), kept_chatter — посторонние сообщения, которые всё равно уйдут дальше.
+    """
+    missed = [text for text, relevant in samples if relevant and not is_relevant(text, chatter_words)]
+    kept_chatter = [text for text, relevant in samples if not relevant and is_relevant(text, chatter_words)]
+    chatter_total = sum(1 for _, relevant in samples if not relevant)
+    return {
+        "total": len(samples),
+        "missed": missed,
+        "kept_chatter": kept_chatter,
+        "drop_rate": (chatter_total - len(kept_chatter)) / chatter_total if chatter_total else 0.0,
+    }
+
+
+CHATTER_WORDS = BASE_CHATTER_WORDS | learn_chatter(load_labelled_log(EXTRACTION_LOG_PATH))
+
+
+if __name__ == "__main__":
+    # python relevance_filter.py [extractions.jsonl] — проверка фильтра на реальных ответах LLM.
+    # Словарь болтовни учится на первых 80% журнала, проверка идёт на остальных 20%
+    samples = load_labelled_log(sys.argv[1] if len(sys.argv) > 1 else EXTRACTION_LOG_PATH)
+    if not samples:
+        print("Журнал ответов LLM пуст")
+        sys.exit(0)
+    split = len(samples) * 4 // 5
+    chatter = BASE_CHATTER_WORDS | learn_chatter(samples[:split])
+    result = evaluate(samples[split:] or samples, chatter)
+    print(f"Сообщений в проверке: {result['total']}")
+    print(f"Потеряно событий: {len(result['missed'])} {result['missed'][:20]}")
+    print(f"Посторонних пропущено дальше: {len(result['kept_chatter'])}")
+    print(f"Доля отсечённых посторонних сообщений: {result['drop_rate']:.0%}")
+    sys.exit(1 if result["missed"] else 0)
@@ -0,0 +1,151 @@
+import logging
+
+from config import MESSAGE_PAGE_LIMIT
+from session_record import SessionRecord, format_duration, format_minutes
+from state import state
+from stats_store import StatsStore, TopicAggregate, started_sort_key
+
+logger = logging.getLogger(__name__)
+
+
+def get_topic_link(group_id: int, topic_id: int) -> str:
+    logger.debug("Генерация ссылки для группы %s, тема %s", group_id, topic_id)
+    group_str = str(group_id)
+    if group_str.startswith("-100"):
+        chat_identifier = group_str[4:]
+    else:
+        chat_identifier = group_str
+    link = f"https://t.me/c/{chat_identifier}/{topic_id}"
+    logger.debug("Сгенерирована ссылка: %s", link)
+    return link
+
+def format_record(record: SessionRecord, phone: str) -> str:
+    return f"{phone} | {format_minutes(record.started)} | {format_minutes(record.stopped)} | {format_duration(record.downtime)}"
+
+def format_topic_average(aggregate: TopicAggregate) -> str:
+    average = aggregate.average_downtime()
+    if average is None:
+        return "Среднее по пк - 0:00"
+    avg_hours, avg_minutes = divmod(average, 60)
+    marker = " 🔴" if average < 20 else " 🟠" if average < 30 else ""
+    return f"Среднее по пк - {avg_hours}:{avg_minutes:02d}{marker}"
+
+
+def paginate(header: str, blocks: list[str], limit: int) -> list[str]:
+    """
+    Раскладывает блоки отчёта (фрагменты тем, итоги) по страницам не длиннее limit символов.
+    Блок переносится на следующую страницу целиком и делится по строкам, только если сам не помещается
+    на страницу. Отчёт, помещающийся в одну страницу, совпадает с "\n".join([header, *blocks]).
+    """
+    pages: list[str] = []
+    page = [header]
+    size = len(header)
+    for block in blocks:
+        budget = limit - len(header) - 16
+        pieces = [block] if len(block) <= budget else _split_lines(block, budget)
+        for piece in pieces:
+            if size + 1 + len(piece) > limit and len(page) > 1:
+                pages.append("\n".join(page))
+                continuation = f"{header} (стр. {len(pages) + 1})"
+                page, size = [continuation], len(continuation)
+            page.append(piece)
+            size += 1 + len(piece)
+    pages.append("\n".join(page))
+    return pages
+
+def _split_lines(block: str, budget: int) -> list[str]:
+    pieces, current = [], []
+    size = 0
+    for line in block.split("\n"):
+        if current and size + 1 + len(line) > budget:
+            pieces.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += 1 + len(line)
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+class ReportRenderer:
+    """
+    Отрисовка сообщений статистики группы ("grouped" и "daily") с кэшем фрагментов.
+    Фрагмент темы (заголовок со ссылкой, строки записей, среднее) и список записей
+    дневного вида хранятся вместе с версией из StatsStore и перерисовываются,
+    только когда версия их темы или группы изменилась. Отчёт большой группы
+    делится на страницы в пределах лимита длины сообщения Telegram.
+    """
+
+    def __init__(self, store: StatsStore):
+        self.store = store
+        # (csv_filename, group_id, topic_id) -> ((версия темы, номер темы), фрагмент)
+        self._topic_fragments: dict[tuple, tuple[tuple[int, int], str]] = {}
+        # (csv_filename, group_id) -> (версия группы, строки записей дневного вида)
+        self._daily_fragments: dict[tuple, tuple[int, str]] = {}
+        self.counters: dict[str, int] = {"hits": 0, "renders": 0}
+
+    def _topic_fragment(self, csv_filename: str, group_id: int, topic_id: int, number: int) -> str:
+        key = (csv_filename, group_id, topic_id)
+        # Номер темы зависит от её места среди тем группы, поэтому тоже входит в ключ
+        version = (self.store.topic_version(csv_filename, group_id, topic_id), number)
+        cached = self._topic_fragments.get(key)
+        if cached is not None and cached[0] == version:
+            self.counters["hits"] += 1
+            return cached[1]
+        self.counters["renders"] += 1
+        phones = self.store.topic_records(csv_filename, group_id, topic_id)
+        lines = [f"\n<b><a href='{get_topic_link(group_id, topic_id)}'>Тема: {number}</a></b>"]
+        lines.extend(format_record(rec, phone) for phone, rec in sorted(phones.items(), key=lambda item: started_sort_key(item[1])))
+        lines.append(format_topic_average(self.store.topic_aggregate(csv_filename, group_id, topic_id)))
+        fragment = "\n".join(lines)
+        self._topic_fragments[key] = (version, fragment)
+        return fragment
+
+    def _daily_fragment(self, csv_filename: str, group_id: int) -> str:
+        key = (csv_filename, group_id)
+        version = self.store.group_version(csv_filename, group_id)
+        cached = self._daily_fragments.get(key)
+        if cached is not None and cached[0] == version:
+            self.counters["hits"] += 1
+            return cached[1]
+        self.counters["renders"] += 1
+        records = [(phone, rec) for _, phone, rec in self.store.group_records(csv_filename, group_id)]
+        records.sort(key=lambda item: started_sort_key(item[1]))
+        fragment = "\n".join(format_record(rec, phone) for phone, rec in records)
+        self._daily_fragments[key] = (version, fragment)
+        return fragment
+
+    def render_pages(
+        self,
+        csv_filename: str,
+        group_id: int,
+        group_title: str,
+        view_mode: str = "grouped",
+        limit: int = MESSAGE_PAGE_LIMIT
+    ) -> list[str]:
+        """Страницы отчёта группы: одна для обычной группы, несколько — для очень большой."""
+        header = f"Группа: {group_title}"
+        unique_phones = self.store.group_unique_phones(csv_filename, group_id)
+        group_aggregate = self.store.group_aggregate(csv_filename, group_id)
+        if view_mode == "daily":
+            blocks = []
+            records = self._daily_fragment(csv_filename, group_id)
+            if records:
+                blocks.append(records)
+            avg_hours, avg_minutes = divmod(group_aggregate.average_downtime() or 0, 60)
+            blocks.append(
+                f"Среднее по группе: {avg_hours}:{avg_minutes:02d}\n"
+                f"\nПоставили: {unique_phones}\n"
+                f"Стоят сейчас: {group_aggregate.open_count}"
+            )
+        else:
+            topic_ids = sorted(self.store.group_topics(csv_filename, group_id))
+            blocks = [
+                self._topic_fragment(csv_filename, group_id, topic_id, number)
+                for number, topic_id in enumerate(topic_ids, 1)
+            ]
+            blocks.append(f"\n\nПоставили: {unique_phones}\nСтоят сейчас: {group_aggregate.open_count}")
+        return paginate(header, blocks, limit)
+
+
+report_renderer = ReportRenderer(state.stats)
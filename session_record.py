@@ -0,0 +1,82 @@
+from datetime import date, datetime
+
+
+def parse_minutes(value: str | None) -> int | None:
+    """ "HH:MM" -> минуты от начала суток, без strptime."""
+    if not value or len(value) < 5 or value[2] != ":":
+        return None
+    try:
+        hours, minutes = int(value[:2]), int(value[3:5])
+    except ValueError:
+        return None
+    if hours > 23 or minutes > 59:
+        return None
+    return hours * 60 + minutes
+
+
+def format_minutes(minutes: int | None) -> str:
+    if minutes is None:
+        return "-"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}"
+
+
+def format_duration(minutes: int | None) -> str:
+    if not minutes:
+        return "-"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}"
+
+
+def datetime_minutes(value: datetime | None) -> int | None:
+    return value.hour * 60 + value.minute if value is not None else None
+
+
+class SessionRecord:
+    """
+    Сессия номера за день: дата (по Europe/Kiev) и время "встал"/"слетел" в минутах от начала суток.
+    Простой не хранится отдельно, а вычисляется как разность минут, поэтому сортировка,
+    расчёт простоя и форматирование обходятся целочисленной арифметикой.
+    """
+
+    __slots__ = ("day", "started", "stopped")
+
+    def __init__(self, day: date, started: int | None = None, stopped: int | None = None):
+        self.day = day
+        self.started = started
+        self.stopped = stopped
+
+    @classmethod
+    def from_datetimes(cls, started: datetime | None, stopped: datetime | None) -> "SessionRecord":
+        """Запись из меток времени хранилища или журнала."""
+        anchor = started or stopped
+        return cls(anchor.date() if anchor else date.today(), datetime_minutes(started), datetime_minutes(stopped))
+
+    @property
+    def is_open(self) -> bool:
+        return self.started is not None and self.stopped is None
+
+    @property
+    def downtime(self) -> int | None:
+        """Простой в минутах или None, если нет одного из времён."""
+        if self.started is None or self.stopped is None:
+            return None
+        return self.stopped - self.started
+
+    def started_at(self) -> datetime | None:
+        return self._at(self.started)
+
+    def stopped_at(self) -> datetime | None:
+        return self._at(self.stopped)
+
+    def _at(self, minutes: int | None) -> datetime | None:
+        if minutes is None:
+            return None
+        hours, minutes = divmod(minutes, 60)
+        return datetime(self.day.year, self.day.month, self.day.day, hours, minutes)
+
+    def copy(self) -> "SessionRecord":
+        return SessionRecord(self.day, self.started, self.stopped)
+
+    def __repr__(self) -> str:
+        return f"SessionRecord({self.day}, {format_minutes(self.started)}, {format_minutes(self.stopped)})"
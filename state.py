@@ -1,22 +1,14 @@
-from datetime import timedelta, datetime
-import pandas as pd
-from pathlib import Path
+from datetime import datetime
 import logging
 import pytz
 
-logger = logging.getLogger(__name__)
+from config import JOURNAL_COMPACT_EVERY
+from journal import get_journal
+from session_record import SessionRecord
+from stats_store import StatsStore
+from storage import format_timestamp, parse_timestamp, storage
 
-def convert_to_datetime(value):
-    if isinstance(value, str):
-        try:
-            time_part = datetime.strptime(value, "%H:%M").time()
-            now = datetime.now(pytz.timezone("Europe/Kiev"))
-            return datetime.combine(now.date(), time_part)
-        except ValueError:
-            return None
-    elif isinstance(value, datetime):
-        return value
-    return None
+logger = logging.getLogger(__name__)
 
 class BotState:
     def __init__(self):
@@ -24,10 +16,16 @@ class BotState:
         # Для поддержки нескольких сессий (админов), использующих один CSV‑файл:
         # admin_chat_ids: CSV filename -> set(chat_id)
         self.admin_chat_ids: dict[str, set[int]] = {}
-        # Глобальные сообщения: CSV filename -> { chat_id -> { group_id -> message_id } }
-        self.global_message_ids: dict[str, dict[int, dict[int, int]]] = {}
-        # Статистика теперь хранится с ключом: (csv_filename, group_id, topic_id, phone)
-        self.stats = {}
+        # Глобальные сообщения по страницам отчёта: CSV filename -> { chat_id -> { group_id -> [message_id, ...] } }
+        self.global_message_ids: dict[str, dict[int, dict[int, list[int]]]] = {}
+        # Отпечатки последнего отправленного содержимого страниц (текст, режим, клавиатура):
+        # CSV filename -> { chat_id -> { group_id -> [fingerprint, ...] } }
+        self.global_message_fingerprints: dict[str, dict[int, dict[int, list[str | None]]]] = {}
+        # Счётчики правок сообщений статистики: отправленные и пропущенные как неизменившиеся
+        self.edit_counters: dict[str, int] = {"sent": 0, "skipped": 0}
+        # Статистика теперь хранится с ключом: (csv_filename, group_id, topic_id, phone),
+        # с индексами аккаунт -> группа -> тема (см. StatsStore)
+        self.stats = StatsStore()
         self.topic_names = {}  # (group_id, topic_id) -> topic name
         self.last_phone = {}   # (group_id, topic_id) -> phone
         self.group_titles = {} # group_id -> group title
@@ -39,61 +37,136 @@ class BotState:
         # Новая структура: для каждой группы – набор CSV‑файлов (ключей), к которым она привязана
         self.group_to_keys: dict[int, set[str]] = {}
 
-    def save_to_csv(self, filename: str = 'stats.csv'):
+    def save_to_csv(self, filename: str = 'stats.csv') -> bool:
         if not self.stats:
             logger.info("Нет данных для сохранения в CSV.")
-            return
+            return False
         data = []
-        for (file_key, group_id, topic_id, phone), record in self.stats.items():
-            # Сохраняем записи только для нужного CSV‑файла
-            if file_key != filename:
-                continue
-            started = convert_to_datetime(record.get("started"))
-            stopped = convert_to_datetime(record.get("stopped"))
-            started_str = started.strftime("%Y-%m-%dT%H:%M:%S") if started else None
-            stopped_str = stopped.strftime("%Y-%m-%dT%H:%M:%S") if stopped else None
-            downtime = record.get("downtime").total_seconds() if record.get("downtime") else None
+        # Сохраняем записи только для нужного CSV‑файла (копия, т.к. вызывается из потока записи)
+        for (_, group_id, topic_id, phone), record in self.stats.account_snapshot(filename):
             data.append({
                 "group_id": group_id,
                 "topic_id": topic_id,
                 "phone": phone,
-                "started": started_str,
-                "stopped": stopped_str,
-                "downtime": downtime,
+                "started": record.started_at(),
+                "stopped": record.stopped_at(),
+                "downtime": record.downtime * 60 if record.downtime else None,
                 "topic_name": self.topic_names.get((group_id, topic_id)),
-                "global_message_id": None,
                 "last_phone": self.last_phone.get((group_id, topic_id)),
                 "group_title": self.group_titles.get(group_id)
             })
         try:
-            df = pd.DataFrame(data)
-            df.to_csv(filename, index=False)
+            local_now = datetime.now(pytz.timezone("Europe/Kiev")).date()
+            storage.save_account(filename, data, local_now)
             logger.info(f"Данные успешно сохранены в {filename}")
+            return True
         except Exception as e:
             logger.error(f"Ошибка при сохранении данных в CSV: {e}")
+            return False
 
-    def load_from_csv(self, filename: str = 'stats.csv'):
-        if not Path(filename).exists():
-            logger.info(f"Файл {filename} не найден. Начинаем с пустой статистикой.")
+    def journal_mutation(self, op: str, key: tuple) -> None:
+        """
+        Дописывает в журнал аккаунта мутацию записи: "start" (создана запись "встал")
+        или "stop" (проставлены "слетел" и простой). Вместо перезаписи всего CSV.
+        """
+        filename, group_id, topic_id, phone = key
+        record = self.stats[key]
+        get_journal(filename).append({
+            "op": op,
+            "group_id": group_id,
+            "topic_id": topic_id,
+            "phone": phone,
+            "started": format_timestamp(record.started_at()),
+            "stopped": format_timestamp(record.stopped_at()),
+            "downtime": record.downtime * 60 if record.downtime else None,
+            "topic_name": self.topic_names.get((group_id, topic_id)),
+            "last_phone": self.last_phone.get((group_id, topic_id)),
+            "group_title": self.group_titles.get(group_id)
+        })
+
+    def flush_account(self, filename: str = 'stats.csv', compact: bool = False) -> None:
+        """
+        Сбрасывает на диск накопленные изменения аккаунта: дописывает журнал, а если он
+        разросся до JOURNAL_COMPACT_EVERY (или compact=True) — сворачивает его в снимок CSV.
+        Вызывается из потока записи (см. persistence.py).
+        В SQLite буфер журнала сразу применяется к таблицам базы, а файловый журнал не растёт.
+        """
+        journal = get_journal(filename)
+        if not storage.journaled:
+            pending = journal.take_pending()
+            if pending:
+                try:
+                    local_now = datetime.now(pytz.timezone("Europe/Kiev")).date()
+                    storage.apply_mutations(filename, pending, local_now)
+                except Exception as e:
+                    logger.error(f"Ошибка записи изменений {filename} в базу: {e}")
+                    journal.restore(pending)
+                    return
+            if not compact:
+                return
+        if not compact and journal.size < JOURNAL_COMPACT_EVERY:
+            journal.flush()
             return
+        # Буфер забираем до снимка: всё, что в нём было, уже отражено в памяти и попадёт в CSV
+        pending = journal.take_pending()
+        if self.save_to_csv(filename):
+            journal.truncate()
+        else:
+            journal.flush(pending)
+
+    def _replay_journal(self, filename: str) -> None:
+        entries = get_journal(filename).all_entries()
+        if not entries:
+            return
+        local_now = datetime.now(pytz.timezone("Europe/Kiev")).date()
+        applied = 0
+        for entry in entries:
+            started = parse_timestamp(entry.get("started"))
+            stopped = parse_timestamp(entry.get("stopped"))
+            if (started.date() if started else None) != local_now and (stopped.date() if stopped else None) != local_now:
+                continue
+            group_id, topic_id = entry["group_id"], entry["topic_id"]
+            key = (filename, group_id, topic_id, entry["phone"])
+            # "start" не затирает уже существующую запись, "stop" переносит её итоговое состояние
+            if entry["op"] == "start" and key in self.stats:
+                continue
+            self.stats[key] = SessionRecord.from_datetimes(started, stopped)
+            if entry.get("topic_name") is not None:
+                self.topic_names[(group_id, topic_id)] = entry["topic_name"]
+            if entry.get("last_phone") is not None:
+                self.last_phone[(group_id, topic_id)] = entry["last_phone"]
+            if entry.get("group_title") is not None:
+                self.group_titles[group_id] = entry["group_title"]
+            applied += 1
+        logger.info(f"Из журнала {filename} применено записей: {applied}")
+
+    def load_from_csv(self, filename: str = 'stats.csv'):
+        # Имя CSV‑файла остаётся идентификатором аккаунта и для других хранилищ (см. storage.py)
         try:
-            df = pd.read_csv(filename)
             local_now = datetime.now(pytz.timezone("Europe/Kiev")).date()
-            for _, row in df.iterrows():
-                started_date = pd.to_datetime(row['started']).date() if pd.notna(row['started']) else None
-                stopped_date = pd.to_datetime(row['stopped']).date() if pd.notna(row['stopped']) else None
-                if started_date == local_now or stopped_date == local_now:
-                    key = (filename, row['group_id'], row['topic_id'], row['phone'])
-                    self.stats[key] = {
-                        "started": pd.to_datetime(row['started']) if pd.notna(row['started']) else None,
-                        "stopped": pd.to_datetime(row['stopped']) if pd.notna(row['stopped']) else None,
-                        "downtime": timedelta(seconds=row['downtime']) if pd.notna(row['downtime']) else None
-                    }
-                    self.topic_names[(row['group_id'], row['topic_id'])] = row['topic_name']
-                    self.last_phone[(row['group_id'], row['topic_id'])] = row['last_phone']
-                    self.group_titles[row['group_id']] = row['group_title']
-            logger.info(f"Данные успешно загружены из {filename}")
+            rows = storage.load_account(filename, local_now)
+            for row in rows:
+                group_id, topic_id = row["group_id"], row["topic_id"]
+                # Простой не читается: он однозначно вычисляется из времён "встал" и "слетел"
+                self.stats[(filename, group_id, topic_id, row["phone"])] = SessionRecord.from_datetimes(
+                    row["started"], row["stopped"]
+                )
+                if row["topic_name"]:
+                    self.topic_names[(group_id, topic_id)] = row["topic_name"]
+                if row["last_phone"]:
+                    self.last_phone[(group_id, topic_id)] = row["last_phone"]
+                if row["group_title"]:
+                    self.group_titles[group_id] = row["group_title"]
+            logger.info(f"Данные успешно загружены для {filename}: {len(rows)} записей за сегодня")
         except Exception as e:
             logger.error(f"Ошибка при загрузке данных из CSV: {e}")
 
+    def load(self, filename: str = 'stats.csv'):
+        """Загружает снимок CSV и применяет поверх него хвост журнала."""
+        self.load_from_csv(filename)
+        try:
+            self._replay_journal(filename)
+        except Exception as e:
+            logger.error(f"Ошибка при применении журнала для {filename}: {e}")
+
 state = BotState()
@@ -1,53 +1,113 @@
-import asyncio
+import hashlib
+import json
 import logging
 import re
 
 import pytz
 from datetime import datetime
 
-from telegram import Update
+from telegram import Update, InlineKeyboardMarkup
 import logging
 import pytz
 from datetime import datetime
 from telegram.ext import CallbackContext
+from config import FANOUT_CONCURRENCY, STATS_REFRESH_INTERVAL
+from persistence import persistence_worker
 from keyboards import get_daily_stats_keyboard, get_group_stats_keyboard, get_stop_keyboard, get_start_keyboard, \
     get_main_keyboard
+from refresh_scheduler import RefreshScheduler
 from state import state
-from utils import extract_event_info
-from utils_helpers import ensure_datetime, convert_to_datetime
+from extraction import extract_event
+from load_shedding import load_shedder
+from outbound import PRIORITY_REPORT, outbound_sender, reply
+from report_renderer import report_renderer
+from session_record import SessionRecord, parse_minutes
+from utils_helpers import fan_out
 from wrapper import require_auth
 
 logger = logging.getLogger(__name__)
 
-def get_topic_link(group_id: int, topic_id: int) -> str:
-    logger.debug("Генерация ссылки для группы %s, тема %s", group_id, topic_id)
-    group_str = str(group_id)
-    if group_str.startswith("-100"):
-        chat_identifier = group_str[4:]
-    else:
-        chat_identifier = group_str
-    link = f"https://t.me/c/{chat_identifier}/{topic_id}"
-    logger.debug("Сгенерирована ссылка: %s", link)
-    return link
-
-def format_record(record: dict, phone: str) -> str:
-    logger.debug("Форматирование записи для номера %s", phone)
-    started = record.get("started")
-    stopped = record.get("stopped")
-    started = convert_to_datetime(started) if isinstance(started, str) else started
-    stopped = convert_to_datetime(stopped) if isinstance(stopped, str) else stopped
-    started_str = started.strftime("%H:%M") if started else "-"
-    stopped_str = stopped.strftime("%H:%M") if stopped else "-"
-    downtime = record.get("downtime")
-    if downtime:
-        total_minutes = int(downtime.total_seconds() // 60)
-        hours, minutes = divmod(total_minutes, 60)
-        downtime_str = f"{hours}:{minutes:02d}"
-    else:
-        downtime_str = "-"
-    formatted = f"{phone} | {started_str} | {stopped_str} | {downtime_str}"
-    logger.debug("Отформатированная запись: %s", formatted)
-    return formatted
+def render_fingerprint(text: str, view_mode: str, keyboard: InlineKeyboardMarkup) -> str:
+    payload = json.dumps(keyboard.to_dict() if keyboard else None, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(f"{view_mode}\x00{text}\x00{payload}".encode("utf-8")).hexdigest()
+
+async def deliver_report(
+    context: CallbackContext,
+    csv_filename: str,
+    admin_chat_id: int,
+    group_id: int,
+    pages: list[str],
+    keyboard: InlineKeyboardMarkup,
+    view_mode: str
+) -> None:
+    """
+    Отправляет или редактирует страницы статистики группы в чате админа (по сообщению на страницу).
+    Правится только страница, у которой изменились текст, режим или клавиатура; клавиатура
+    прикрепляется к последней странице. Лишние страницы после сокращения отчёта удаляются.
+    Запросы идут через очередь outbound_sender с учётом лимитов Telegram, а отпечаток
+    запоминается при постановке в очередь, чтобы повторное обновление не ставило ту же правку.
+    В режиме деградации над первой страницей выводится предупреждение.
+    """
+    banner = load_shedder.banner()
+    if banner:
+        pages = [f"{banner}\n\n{pages[0]}", *pages[1:]]
+    message_ids = state.global_message_ids.setdefault(csv_filename, {}).setdefault(admin_chat_id, {}).setdefault(group_id, [])
+    fingerprints = state.global_message_fingerprints.setdefault(csv_filename, {}).setdefault(admin_chat_id, {}).setdefault(group_id, [])
+    for index, text in enumerate(pages):
+        page_keyboard = keyboard if index == len(pages) - 1 else None
+        fingerprint = render_fingerprint(text, view_mode, page_keyboard)
+        if index >= len(fingerprints):
+            fingerprints.append(None)
+        try:
+            if index < len(message_ids):
+                if fingerprints[index] == fingerprint:
+                    state.edit_counters["skipped"] += 1
+                    logger.debug("Страница %s в чате %s для группы %s не изменилась, правка пропущена", index + 1, admin_chat_id, group_id)
+                    continue
+                fingerprints[index] = fingerprint
+                await outbound_sender.edit_message_text(
+                    context.bot,
+                    admin_chat_id,
+                    message_ids[index],
+                    PRIORITY_REPORT,
+                    text=text,
+                    reply_markup=page_keyboard,
+                    parse_mode='HTML'
+                )
+                state.edit_counters["sent"] += 1
+                logger.info("Обновлена страница %s в чате %s для группы %s", index + 1, admin_chat_id, group_id)
+            else:
+                sent_msg = await outbound_sender.send_message(
+                    context.bot,
+                    admin_chat_id,
+                    PRIORITY_REPORT,
+                    text=text,
+                    reply_markup=page_keyboard,
+                    parse_mode='HTML'
+                )
+                message_ids.append(sent_msg.message_id)
+                logger.info("Создана страница %s в чате %s для группы %s с id %s", index + 1, admin_chat_id, group_id, sent_msg.message_id)
+                fingerprints[index] = fingerprint
+        except Exception as e:
+            if "message is not modified" in str(e).lower():
+                # Содержимое уже совпадает с отправленным, отпечаток запомнен при постановке в очередь
+                state.edit_counters["skipped"] += 1
+                continue
+            logger.error("Ошибка при обновлении/отправке страницы %s в чате %s для группы %s: %s", index + 1, admin_chat_id, group_id, e)
+            if index < len(fingerprints):
+                # Правка не дошла, а с ней и слитые в неё правки других вызовов — содержимое страницы неизвестно,
+                # поэтому следующее обновление должно отправить её заново
+                fingerprints[index] = None
+            if index >= len(message_ids):
+                # Без отправленной страницы следующие нельзя привязать к своим местам
+                break
+    for message_id in message_ids[len(pages):]:
+        try:
+            await outbound_sender.delete_message(context.bot, admin_chat_id, message_id, PRIORITY_REPORT)
+        except Exception as e:
+            logger.error("Не удалось удалить лишнюю страницу %s в чате %s: %s", message_id, admin_chat_id, e)
+    del message_ids[len(pages):]
+    del fingerprints[len(message_ids):]
 
 async def update_global_message(
     group_id: int,
@@ -64,130 +124,51 @@ async def update_global_message(
         return
 
     if view_mode == "grouped":
-        lines = [f"Группа: {group_title}"]
-        topics = {}
-        unique_phones_today = set()
-        standing_now = 0
-        # Фильтруем статистику по нужному csv_filename
-        for (file_key, g_id, topic_id, phone), rec in state.stats.items():
-            if file_key != csv_filename:
-                continue
-            if g_id == group_id:
-                topics.setdefault(topic_id, []).append((phone, rec))
-                unique_phones_today.add(phone)
-                if rec.get("started") and not rec.get("stopped"):
-                    standing_now += 1
-        topic_counter = 0
-        for tid in sorted(topics.keys()):
-            topic_counter += 1
-            topic_link = get_topic_link(group_id, tid)
-            lines.append(f"\n<b><a href='{topic_link}'>Тема: {topic_counter}</a></b>")
-            topic_lines = []
-            topic_total_seconds = 0
-            topic_count = 0
-            sorted_entries = sorted(
-                topics[tid],
-                key=lambda item: ensure_datetime(item[1].get("started")).time()
-                if ensure_datetime(item[1].get("started")) else datetime.min.time()
-            )
-            for phone, rec in sorted_entries:
-                topic_lines.append(format_record(rec, phone))
-                if rec.get("downtime"):
-                    topic_total_seconds += rec["downtime"].total_seconds()
-                    topic_count += 1
-            lines.extend(topic_lines)
-            if topic_count:
-                avg_seconds = topic_total_seconds / topic_count
-                avg_hours = int(avg_seconds // 3600)
-                avg_minutes = int((avg_seconds % 3600) // 60)
-                total_avg_minutes = avg_hours * 60 + avg_minutes
-                marker = " 🔴" if total_avg_minutes < 20 else " 🟠" if total_avg_minutes < 30 else ""
-                lines.append(f"Среднее по пк - {avg_hours}:{avg_minutes:02d}{marker}")
-            else:
-                lines.append("Среднее по пк - 0:00")
-        lines.append(f"\n\nПоставили: {len(unique_phones_today)}")
-        lines.append(f"Стоят сейчас: {standing_now}")
-        final_message = "\n".join(lines)
         # Предлагаем кнопку для переключения в режим daily
         keyboard = get_daily_stats_keyboard(group_id)
     elif view_mode == "daily":
-        lines = [f"Группа: {group_title}"]
-        total_seconds = 0
-        count = 0
-        unique_phones_today = set()
-        standing_now = 0
-        # Здесь также фильтруем записи по csv_filename
-        daily_records = [(phone, rec) for (file_key, g_id, _, phone), rec in state.stats.items()
-                         if file_key == csv_filename and g_id == group_id]
-        daily_sorted = sorted(
-            daily_records,
-            key=lambda item: ensure_datetime(item[1].get("started")).time()
-            if ensure_datetime(item[1].get("started")) else datetime.min.time()
-        )
-
-        for phone, rec in daily_sorted:
-            lines.append(format_record(rec, phone))
-            if rec.get("downtime"):
-                total_seconds += rec["downtime"].total_seconds()
-                count += 1
-            unique_phones_today.add(phone)
-            if rec.get("started") and not rec.get("stopped"):
-                standing_now += 1
-        if count:
-            avg_seconds = total_seconds / count
-            avg_hours = int(avg_seconds // 3600)
-            avg_minutes = int((avg_seconds % 3600) // 60)
-        else:
-            avg_hours, avg_minutes = 0, 0
-        lines.append(f"Среднее по группе: {avg_hours}:{avg_minutes:02d}")
-        lines.append(f"\nПоставили: {len(unique_phones_today)}")
-        lines.append(f"Стоят сейчас: {standing_now}")
-        final_message = "\n".join(lines)
         # Кнопка для переключения в режим grouped
         keyboard = get_group_stats_keyboard(group_id)
     else:
         logger.error("Неверный режим отображения: %s", view_mode)
         return
-
-    if csv_filename not in state.global_message_ids:
-        state.global_message_ids[csv_filename] = {}
-    for admin_chat_id in admin_chat_ids:
-        global_msgs = state.global_message_ids[csv_filename]
-        try:
-            if admin_chat_id in global_msgs and group_id in global_msgs[admin_chat_id]:
-                await context.bot.edit_message_text(
-                    chat_id=admin_chat_id,
-                    message_id=global_msgs[admin_chat_id][group_id],
-                    text=final_message,
-                    reply_markup=keyboard,
-                    parse_mode='HTML'
-                )
-                logger.info("Обновлено сообщение в чате %s для группы '%s'", admin_chat_id, group_title)
-            else:
-                sent_msg = await context.bot.send_message(
-                    chat_id=admin_chat_id,
-                    text=final_message,
-                    reply_markup=keyboard,
-                    parse_mode='HTML'
-                )
-                if admin_chat_id not in global_msgs:
-                    global_msgs[admin_chat_id] = {}
-                global_msgs[admin_chat_id][group_id] = sent_msg.message_id
-                logger.info("Создано сообщение в чате %s для группы '%s' с id %s", admin_chat_id, group_title, sent_msg.message_id)
-        except Exception as e:
-            logger.error("Ошибка при обновлении/отправке сообщения в чате %s для группы %s: %s", admin_chat_id, group_id, e)
+    # Перерисовываются только фрагменты тем, записи которых изменились
+    pages = report_renderer.render_pages(csv_filename, group_id, group_title, view_mode)
+
+    # Отчёт отрисован один раз и рассылается всем админам параллельно
+    await fan_out(
+        list(admin_chat_ids),
+        lambda admin_chat_id: deliver_report(context, csv_filename, admin_chat_id, group_id, pages, keyboard, view_mode),
+        FANOUT_CONCURRENCY,
+        f"обновления группы {group_id}"
+    )
 
 
 async def update_all_stats(context: CallbackContext, view_mode: str = "grouped") -> None:
     # Для каждого активного CSV‑файла обновляем сообщения только для групп,
     # у которых есть статистика для данного файла
-    for csv_filename in state.admin_chat_ids.keys():
+    targets = [
+        (csv_filename, group_id)
+        for csv_filename in list(state.admin_chat_ids.keys())
         # Выбираем группы для этого csv_filename
-        group_ids = {group_id for (file_key, group_id, _, _) in state.stats.keys() if file_key == csv_filename}
-        for group_id in group_ids:
-            group_title = state.group_titles.get(group_id, str(group_id))
-            await update_global_message(group_id, group_title, context, view_mode=view_mode, csv_filename=csv_filename)
-        state.save_to_csv(csv_filename)
+        for group_id in state.stats.account_groups(csv_filename)
+    ]
+
+    async def refresh(target: tuple[str, int]) -> None:
+        csv_filename, group_id = target
+        group_title = state.group_titles.get(group_id, str(group_id))
+        await update_global_message(group_id, group_title, context, view_mode=view_mode, csv_filename=csv_filename)
+
+    await fan_out(targets, refresh, FANOUT_CONCURRENCY, "обновления статистики")
+
+async def refresh_group(csv_filename: str, group_id: int, context: CallbackContext) -> None:
+    # Группа могла потерять всех админов, пока изменение ожидало обновления
+    if not state.admin_chat_ids.get(csv_filename):
+        return
+    group_title = state.group_titles.get(group_id, str(group_id))
+    await update_global_message(group_id, group_title, context, view_mode="grouped", csv_filename=csv_filename)
+
+refresh_scheduler = RefreshScheduler(STATS_REFRESH_INTERVAL, refresh_group, FANOUT_CONCURRENCY)
 
 async def send_grouped_stats(context: CallbackContext) -> None:
     logger.info("Отправка сгруппированной статистики")
@@ -197,68 +178,16 @@ async def send_grouped_stats(context: CallbackContext) -> None:
         logger.warning("Нет chat_id для CSV файла %s", csv_filename)
         return
 
-    groups = {}
-
-    for (file_key, group_id, topic_id, phone), rec in state.stats.items():
-        if file_key != csv_filename:
-            continue
-        groups.setdefault(group_id, {}).setdefault(topic_id, []).append((phone, rec))
-    for g_id, topics in groups.items():
+    for g_id in state.stats.account_groups(csv_filename):
         group_title = state.group_titles.get(g_id, str(g_id))
-        lines = [f"Группа: {group_title}"]
-        topic_counter = 0
-        for tid in sorted(topics.keys()):
-            topic_counter += 1
-            topic_link = get_topic_link(g_id, tid)
-            lines.append(f"\n<b><a href='{topic_link}'>Тема: {topic_counter}</a></b>")
-            topic_lines = []
-            topic_total_seconds = 0
-            topic_count = 0
-            for phone, rec in topics[tid]:
-                topic_lines.append(format_record(rec, phone))
-                if rec.get("downtime"):
-                    topic_total_seconds += rec["downtime"].total_seconds()
-                    topic_count += 1
-            topic_lines.sort()
-            lines.extend(topic_lines)
-            if topic_count:
-                avg_seconds = topic_total_seconds / topic_count
-                avg_hours = int(avg_seconds // 3600)
-                avg_minutes = int((avg_seconds % 3600) // 60)
-                total_avg_minutes = avg_hours * 60 + avg_minutes
-                marker = " 🔴" if total_avg_minutes < 20 else " 🟠" if total_avg_minutes < 30 else ""
-                lines.append(f"Среднее по пк - {avg_hours}:{avg_minutes:02d}{marker}")
-            else:
-                lines.append("Среднее по пк - 0:00")
-        final_message = "\n".join(lines)
+        pages = report_renderer.render_pages(csv_filename, g_id, group_title, "grouped")
         keyboard = get_daily_stats_keyboard(g_id)
-        if csv_filename not in state.global_message_ids:
-            state.global_message_ids[csv_filename] = {}
-        for admin_chat_id in admin_chat_ids:
-            global_msgs = state.global_message_ids[csv_filename]
-            try:
-                if admin_chat_id in global_msgs and g_id in global_msgs[admin_chat_id]:
-                    await context.bot.edit_message_text(
-                        chat_id=admin_chat_id,
-                        message_id=global_msgs[admin_chat_id][g_id],
-                        text=final_message,
-                        reply_markup=keyboard,
-                        parse_mode='HTML'
-                    )
-                    logger.info("Обновлено сообщение в чате %s для группы %s", admin_chat_id, g_id)
-                else:
-                    sent_msg = await context.bot.send_message(
-                        chat_id=admin_chat_id,
-                        text=final_message,
-                        reply_markup=keyboard,
-                        parse_mode='HTML'
-                    )
-                    if admin_chat_id not in global_msgs:
-                        global_msgs[admin_chat_id] = {}
-                    global_msgs[admin_chat_id][g_id] = sent_msg.message_id
-                    logger.info("Создано сообщение в чате %s для группы %s с id %s", admin_chat_id, g_id, sent_msg.message_id)
-            except Exception as e:
-                logger.error("Ошибка при обновлении/отправке сообщения в чате %s для группы %s: %s", admin_chat_id, g_id, e)
+        await fan_out(
+            list(admin_chat_ids),
+            lambda admin_chat_id: deliver_report(context, csv_filename, admin_chat_id, g_id, pages, keyboard, "grouped"),
+            FANOUT_CONCURRENCY,
+            f"отправки группы {g_id}"
+        )
 
 @require_auth
 async def start_tracking(update: Update, context: CallbackContext) -> None:
@@ -280,40 +209,36 @@ async def start_tracking(update: Update, context: CallbackContext) -> None:
         if csv_filename in state.global_message_ids:
             if chat_id in state.global_message_ids[csv_filename]:
                 del state.global_message_ids[csv_filename][chat_id]
+        state.global_message_fingerprints.get(csv_filename, {}).pop(chat_id, None)
     state.tracking_active = True
     state.stats.clear()
-    state.load_from_csv(csv_filename)
-    await send_grouped_stats(context)
+    state.load(csv_filename)
+    # Ответ на команду уходит до рассылки отчётов, а не после всех страниц в очереди чата
     if update:
-        if update.message:
-            await update.message.reply_text("Статистика запущена", reply_markup=get_main_keyboard())
-        elif update.callback_query:
-            await update.callback_query.message.reply_text("Статистика запущена", reply_markup=get_main_keyboard())
+        await reply(update, context, "Статистика запущена", reply_markup=get_main_keyboard())
+    await send_grouped_stats(context)
     logger.info("Отслеживание статистики запущено")
 
 @require_auth
 async def stop_tracking(update: Update, context: CallbackContext) -> None:
-    import pytz
-    from datetime import datetime
-    from utils_helpers import convert_to_datetime
-
     logger.info("Остановка отслеживания статистики")
     csv_filename = context.user_data.get('csv_filename', 'stats.csv')
 
-    # Получаем текущее местное время в часовом поясе Europe/Kiev в формате "HH:MM"
+    # Текущее местное время в часовом поясе Europe/Kiev в минутах от начала суток
     local_now = datetime.now(pytz.timezone("Europe/Kiev"))
-    local_now_str = local_now.strftime("%H:%M")
+    local_now_minutes = local_now.hour * 60 + local_now.minute
 
     # Проходим по всем записям для данного CSV‑файла и для активных номеров (без stopped) устанавливаем время остановки
-    for key, record in state.stats.items():
+    for key, record in list(state.stats.account_items(csv_filename)):
         # key = (csv_filename, group_id, topic_id, phone)
-        if key[0] == csv_filename and not record.get("stopped"):
-            record["stopped"] = local_now_str
-            if record.get("started"):
-                started_dt = convert_to_datetime(record.get("started"))
-                stopped_dt = convert_to_datetime(record.get("stopped"))
-                if started_dt and stopped_dt:
-                    record["downtime"] = stopped_dt - started_dt
+        if record.stopped is None:
+            record.stopped = local_now_minutes
+            # Повторная запись закрывает сессию в индексе открытых сессий
+            state.stats[key] = record
+            state.journal_mutation("stop", key)
+
+    # Остановка — естественная точка для снимка: просим поток записи свернуть журнал в CSV
+    persistence_worker.mark_dirty(csv_filename, compact=True)
 
     # Обновляем сообщения для всех групп, связанных с данным ключом
     await update_all_stats(context, view_mode="grouped")
@@ -331,11 +256,7 @@ async def stop_tracking(update: Update, context: CallbackContext) -> None:
     state.tracking_active = False
 
     if update:
-        if update.message:
-            await update.message.reply_text("Статистика остановлена и обновлена", reply_markup=get_main_keyboard())
-        elif update.callback_query:
-            await update.callback_query.message.reply_text("Статистика остановлена и обновлена",
-                                                           reply_markup=get_main_keyboard())
+        await reply(update, context, "Статистика остановлена и обновлена", reply_markup=get_main_keyboard())
     logger.info("Отслеживание статистики остановлено")
 
 
@@ -363,7 +284,7 @@ async def relaunch_stat(update: Update, context: CallbackContext) -> None:
     # Проверяем, авторизован ли пользователь (наличие csv_filename в context.user_data)
     csv_filename = context.user_data.get('csv_filename')
     if not csv_filename:
-        await update.message.reply_text("Вы не авторизованы. Пожалуйста, используйте /start для авторизации.")
+        await reply(update, context, "Вы не авторизованы. Пожалуйста, используйте /start для авторизации.")
         return
     # Вызываем существующую функцию старта сбора статистики
     await start_tracking(update, context)
@@ -386,6 +307,9 @@ async def message_handler(update: Update, context: CallbackContext) -> None:
     message_sent = new_message.date.astimezone(pytz.timezone("Europe/Kiev"))
     chat = new_message.chat
     group_id = chat.id
+    if not load_shedder.accept_message(group_id, new_message.message_id, text, bool(update.edited_message), new_message.date):
+        logger.info(f"Пропущена повторная правка сообщения {new_message.message_id} в группе {group_id}")
+        return
     topic_id = new_message.message_thread_id if new_message.message_thread_id is not None else group_id
     if chat.title:
         state.group_titles[group_id] = chat.title
@@ -403,7 +327,13 @@ async def message_handler(update: Update, context: CallbackContext) -> None:
         logger.info(f"Запомнен номер {phone_candidate} для темы {topic_id} группы {group_id}.")
         return
 
-    extraction = await asyncio.to_thread(extract_event_info, text, topic_id, message_sent)
+    extraction = await extract_event(text, topic_id, message_sent)
+    if load_shedder.take_transition():
+        # Режим деградации включился или снялся — обновляем предупреждение во всех сообщениях статистики
+        for csv_filename, chat_ids in state.admin_chat_ids.items():
+            if chat_ids:
+                for g_id in state.stats.account_groups(csv_filename):
+                    refresh_scheduler.mark_dirty(csv_filename, g_id, context)
     logger.info(f"Извлеченные данные: {extraction}")
 
     if extraction.get("phone") is None and not extraction.get("started", False) and not extraction.get("stopped", False):
@@ -418,8 +348,8 @@ async def message_handler(update: Update, context: CallbackContext) -> None:
     phone_extracted = extraction.get("phone")
     started_flag = extraction.get("started", False)
     stopped_flag = extraction.get("stopped", False)
-    started_time_str = extraction.get("started_time")
-    stopped_time_str = extraction.get("stopped_time")
+    started_minutes = parse_minutes(extraction.get("started_time"))
+    stopped_minutes = parse_minutes(extraction.get("stopped_time"))
     extracted_topic_id = extraction.get("topic_id")
 
     if phone_extracted:
@@ -439,55 +369,41 @@ async def message_handler(update: Update, context: CallbackContext) -> None:
         record = state.stats.get(key)
 
         # Если сообщение содержит событие "встал" и записи ещё нет, создаём новую запись
+        created = False
         if started_flag and record is None:
-            record = {"started": started_time_str, "stopped": None, "downtime": None}
+            record = SessionRecord(message_sent.date(), started_minutes)
+            created = True
 
         # Если сообщение содержит событие "слетел"
         if stopped_flag:
-            if record and record.get("started"):
-                # Обновляем существующую запись, не перезаписывая время "встал"
-                record["stopped"] = stopped_time_str
-                st_time = convert_to_datetime(record["started"])
-                sp_time = convert_to_datetime(record["stopped"])
-                if st_time and sp_time:
-                    record["downtime"] = sp_time - st_time
-                else:
-                    record["downtime"] = None
+            if record and record.started is not None:
+                # Обновляем существующую запись, не перезаписывая время "встал"; простой вычисляется из времён
+                record.stopped = stopped_minutes
             else:
                 # Если записи нет, пытаемся найти подходящую запись по номеру,
                 # где зафиксировано событие "встал", но отсутствует "слетел"
-                candidate_key = None
-                candidate_record = None
-                for (f, g, tid, ph), rec in state.stats.items():
-                    if (
-                            f == csv_filename and g == group_id and tid == extracted_topic_id and
-                            rec.get("started") and not rec.get("stopped")
-                    ):
-                        if candidate_record is None or rec["started"] > candidate_record["started"]:
-                            candidate_key = (f, g, tid, ph)
-                            candidate_record = rec
+                candidate_key, candidate_record = state.stats.latest_open_session(
+                    csv_filename, group_id, extracted_topic_id
+                )
                 if candidate_record is None:
                     logger.info("Нет записи 'встал' для события 'слетел'.")
                     continue
                 key = candidate_key
                 record = candidate_record
-                record["stopped"] = stopped_time_str
-                st_time = convert_to_datetime(record["started"])
-                sp_time = convert_to_datetime(record["stopped"])
-                if st_time and sp_time:
-                    record["downtime"] = sp_time - st_time
-                else:
-                    record["downtime"] = None
+                record.stopped = stopped_minutes
 
         # Если сообщение содержит только событие "встал" и запись уже существует, не затираем значение "started"
-        if started_flag and record and record.get("started"):
+        if started_flag and record and record.started is not None:
             # Можно оставить запись без изменений или обновить, если нужно сверять время (например, если изменилось время "встал")
             pass
 
         state.stats[key] = record
-
-    # После обработки сообщения обновляем статистику для всех аккаунтов, к которым привязана группа
-    await update_all_stats(context)
-    # Сохраняем данные для каждого CSV‑файла отдельно
-    for csv_filename in csv_filenames:
-        state.save_to_csv(csv_filename)
+        # Дописываем изменение в журнал аккаунта вместо перезаписи всего CSV
+        if stopped_flag:
+            state.journal_mutation("stop", key)
+        elif created:
+            state.journal_mutation("start", key)
+        # Запись на диск выполнит фоновый поток, обработчик только помечает аккаунт
+        persistence_worker.mark_dirty(csv_filename)
+        # Обновляем только сообщение изменённой группы, накопив изменения за окно планировщика
+        refresh_scheduler.mark_dirty(csv_filename, group_id, context)
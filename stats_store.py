@@ -0,0 +1,249 @@
+import logging
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+from collections.abc import MutableMapping
+
+from session_record import SessionRecord
+
+logger = logging.getLogger(__name__)
+
+
+def session_is_open(record: SessionRecord | None) -> bool:
+    return record is not None and record.is_open
+
+
+def started_sort_key(record: SessionRecord) -> int:
+    """Минуты "встал" от начала суток; записи без "встал" идут первыми."""
+    return record.started if record.started is not None else -1
+
+
+class TopicAggregate:
+    """Текущие итоги темы (или группы): сумма и число ненулевых простоев в минутах, число открытых сессий."""
+
+    __slots__ = ("downtime_sum", "downtime_count", "open_count")
+
+    def __init__(self):
+        self.downtime_sum = 0
+        self.downtime_count = 0
+        self.open_count = 0
+
+    def average_downtime(self) -> int | None:
+        """Средний простой в минутах или None, если закрытых сессий нет."""
+        return self.downtime_sum // self.downtime_count if self.downtime_count else None
+
+    def add(self, other: "TopicAggregate") -> None:
+        self.downtime_sum += other.downtime_sum
+        self.downtime_count += other.downtime_count
+        self.open_count += other.open_count
+
+
+class StatsStore(MutableMapping):
+    """
+    Хранилище статистики с ключом (csv_filename, group_id, topic_id, phone).
+    Помимо плоского словаря поддерживает вторичные индексы
+    аккаунт -> группа -> тема -> {phone: record}, чтобы отрисовка группы
+    обходила только записи этой группы, а не всю статистику.
+    Итоги по темам (простой, открытые сессии) и уникальные номера групп
+    пересчитываются за O(1) при каждой записи, а не при каждой отрисовке.
+    """
+
+    def __init__(self):
+        # Структуру меняет цикл событий, а снимки для записи на диск читает фоновый поток
+        self._lock = threading.RLock()
+        self._records: dict[tuple, SessionRecord] = {}
+        # csv_filename -> { group_id -> { topic_id -> { phone -> record } } }
+        self._index: dict[str, dict[int, dict[int, dict[str, SessionRecord]]]] = {}
+        # Открытые сессии ("встал" без "слетел"):
+        # (csv_filename, group_id, topic_id) -> отсортированный список (started_sort_key, seq, phone).
+        # seq разрешает равные времена в пользу более поздней записи и избавляет от сравнения номеров
+        self._open: dict[tuple, list[tuple[int, int, str]]] = {}
+        # key -> (started_sort_key, seq), под которыми запись лежит в self._open
+        self._open_keys: dict[tuple, tuple[int, int]] = {}
+        self._open_seq = 0
+        # (csv_filename, group_id, topic_id) -> итоги темы
+        self._aggregates: dict[tuple, TopicAggregate] = {}
+        # (csv_filename, group_id) -> { phone -> число тем группы с этим номером }
+        self._group_phones: dict[tuple, Counter] = {}
+        # key -> (простой в минутах или None, открыта ли сессия), учтённые в итогах темы
+        self._contributions: dict[tuple, tuple[int | None, bool]] = {}
+        # Версии тем (csv_filename, group_id, topic_id) и групп (csv_filename, group_id):
+        # меняются при каждом изменении их записей, по ним кэшируются отрисованные фрагменты.
+        # Счётчик общий и не сбрасывается, поэтому версия не повторяется и после удаления темы
+        self._versions: dict[tuple, int] = {}
+        self._version_seq = 0
+
+    def __getitem__(self, key):
+        return self._records[key]
+
+    def __setitem__(self, key, record):
+        with self._lock:
+            self._set(key, record)
+
+    def _set(self, key, record):
+        csv_filename, group_id, topic_id, phone = key
+        self._bump_version(key)
+        if key not in self._records:
+            self._group_phones.setdefault((csv_filename, group_id), Counter())[phone] += 1
+        self._records[key] = record
+        topics = self._index.setdefault(csv_filename, {}).setdefault(group_id, {})
+        topics.setdefault(topic_id, {})[phone] = record
+        self._discard_contribution(key)
+        aggregate = self._aggregates.setdefault((csv_filename, group_id, topic_id), TopicAggregate())
+        contribution = (record.downtime or None, record.is_open)
+        self._contributions[key] = contribution
+        if contribution[0] is not None:
+            aggregate.downtime_sum += contribution[0]
+            aggregate.downtime_count += 1
+        aggregate.open_count += contribution[1]
+        # Запись могла измениться на месте (например, проставлено "слетел"),
+        # поэтому при каждой записи пересчитываем её положение в индексе открытых сессий
+        self._discard_open(key)
+        if session_is_open(record):
+            sort_key = started_sort_key(record)
+            self._open_seq += 1
+            insort(self._open.setdefault((csv_filename, group_id, topic_id), []), (sort_key, self._open_seq, phone))
+            self._open_keys[key] = (sort_key, self._open_seq)
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._delete(key)
+
+    def _delete(self, key):
+        del self._records[key]
+        self._bump_version(key)
+        self._discard_open(key)
+        self._discard_contribution(key)
+        csv_filename, group_id, topic_id, phone = key
+        group_phones = self._group_phones[(csv_filename, group_id)]
+        group_phones[phone] -= 1
+        if group_phones[phone] <= 0:
+            del group_phones[phone]
+        groups = self._index[csv_filename]
+        topics = groups[group_id]
+        del topics[topic_id][phone]
+        # Убираем опустевшие уровни индекса, чтобы группы без записей не отрисовывались
+        if not topics[topic_id]:
+            del topics[topic_id]
+            del self._aggregates[(csv_filename, group_id, topic_id)]
+            if not topics:
+                del groups[group_id]
+                del self._group_phones[(csv_filename, group_id)]
+                if not groups:
+                    del self._index[csv_filename]
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, key):
+        return key in self._records
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._index.clear()
+            self._open.clear()
+            self._open_keys.clear()
+            self._aggregates.clear()
+            self._group_phones.clear()
+            self._contributions.clear()
+            self._versions.clear()
+
+    def _bump_version(self, key) -> None:
+        self._version_seq += 1
+        self._versions[key[:3]] = self._version_seq
+        self._versions[key[:2]] = self._version_seq
+
+    def _discard_contribution(self, key) -> None:
+        contribution = self._contributions.pop(key, None)
+        if contribution is None:
+            return
+        aggregate = self._aggregates[key[:3]]
+        if contribution[0] is not None:
+            aggregate.downtime_sum -= contribution[0]
+            aggregate.downtime_count -= 1
+        aggregate.open_count -= contribution[1]
+
+    def _discard_open(self, key) -> None:
+        position = self._open_keys.pop(key, None)
+        if position is None:
+            return
+        csv_filename, group_id, topic_id, phone = key
+        topic_key = (csv_filename, group_id, topic_id)
+        sessions = self._open[topic_key]
+        pos = bisect_left(sessions, position)
+        if pos < len(sessions) and sessions[pos][:2] == position:
+            del sessions[pos]
+        if not sessions:
+            del self._open[topic_key]
+
+    def latest_open_session(self, csv_filename: str, group_id: int, topic_id: int):
+        """
+        Возвращает (key, record) сессии темы с самым поздним "встал" и без "слетел",
+        либо (None, None), если открытых сессий нет.
+        """
+        sessions = self._open.get((csv_filename, group_id, topic_id))
+        while sessions:
+            _, _, phone = sessions[-1]
+            key = (csv_filename, group_id, topic_id, phone)
+            record = self._records[key]
+            if session_is_open(record):
+                return key, record
+            # Сессию закрыли на месте без повторной записи в хранилище
+            self._discard_open(key)
+            sessions = self._open.get((csv_filename, group_id, topic_id))
+        return None, None
+
+    def account_groups(self, csv_filename: str) -> list[int]:
+        """Возвращает group_id, для которых у аккаунта есть записи."""
+        return list(self._index.get(csv_filename, {}))
+
+    def group_topics(self, csv_filename: str, group_id: int) -> dict[int, dict[str, SessionRecord]]:
+        """Возвращает { topic_id -> { phone -> record } } для группы аккаунта."""
+        return self._index.get(csv_filename, {}).get(group_id, {})
+
+    def topic_records(self, csv_filename: str, group_id: int, topic_id: int) -> dict[str, SessionRecord]:
+        """Возвращает { phone -> record } для темы группы аккаунта."""
+        return self.group_topics(csv_filename, group_id).get(topic_id, {})
+
+    def group_records(self, csv_filename: str, group_id: int):
+        """Итерирует (topic_id, phone, record) по всем темам группы аккаунта."""
+        for topic_id, phones in self.group_topics(csv_filename, group_id).items():
+            for phone, record in phones.items():
+                yield topic_id, phone, record
+
+    def topic_version(self, csv_filename: str, group_id: int, topic_id: int) -> int:
+        return self._versions.get((csv_filename, group_id, topic_id), 0)
+
+    def group_version(self, csv_filename: str, group_id: int) -> int:
+        return self._versions.get((csv_filename, group_id), 0)
+
+    def topic_aggregate(self, csv_filename: str, group_id: int, topic_id: int) -> TopicAggregate:
+        """Итоги темы; для темы без записей — пустые."""
+        return self._aggregates.get((csv_filename, group_id, topic_id)) or TopicAggregate()
+
+    def group_aggregate(self, csv_filename: str, group_id: int) -> TopicAggregate:
+        """Итоги группы — сумма итогов её тем."""
+        total = TopicAggregate()
+        for topic_id in self.group_topics(csv_filename, group_id):
+            total.add(self._aggregates[(csv_filename, group_id, topic_id)])
+        return total
+
+    def group_unique_phones(self, csv_filename: str, group_id: int) -> int:
+        """Число разных номеров группы за день ("Поставили")."""
+        return len(self._group_phones.get((csv_filename, group_id), ()))
+
+    def account_items(self, csv_filename: str):
+        """Итерирует (key, record) только по записям указанного аккаунта."""
+        for group_id, topics in self._index.get(csv_filename, {}).items():
+            for topic_id, phones in topics.items():
+                for phone, record in phones.items():
+                    yield (csv_filename, group_id, topic_id, phone), record
+
+    def account_snapshot(self, csv_filename: str) -> list[tuple[tuple, SessionRecord]]:
+        """Потокобезопасная копия (key, record) записей аккаунта для записи на диск."""
+        with self._lock:
+            return [(key, record.copy()) for key, record in self.account_items(csv_filename)]
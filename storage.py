@@ -0,0 +1,324 @@
+import csv
+import logging
+import sqlite3
+import sys
+from contextlib import closing
+from datetime import date, datetime
+from pathlib import Path
+
+from config import ACCESS_KEYS, SQLITE_PATH, STORAGE_BACKEND
+from groups_csv import load_allowed_groups, save_allowed_groups
+from journal import get_journal
+from utils_helpers import atomic_open
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+CSV_FIELDNAMES = [
+    "group_id", "topic_id", "phone", "started", "stopped", "downtime",
+    "topic_name", "global_message_id", "last_phone", "group_title"
+]
+
+# Строка статистики, которой обмениваются BotState и хранилища:
+# { group_id: int, topic_id: int, phone: str, started: datetime | None, stopped: datetime | None,
+#   downtime: float | None (секунды), topic_name, last_phone, group_title: str | None }
+
+
+def parse_timestamp(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def format_timestamp(value: datetime | None) -> str | None:
+    return value.strftime(TIMESTAMP_FORMAT) if value else None
+
+
+def row_is_on_day(row: dict, day: date) -> bool:
+    started, stopped = row["started"], row["stopped"]
+    return (started is not None and started.date() == day) or (stopped is not None and stopped.date() == day)
+
+
+def entry_day(row: dict) -> date | None:
+    """День строки или мутации журнала: по времени "встал", а если его нет — по "слетел"."""
+    moment = row["started"] or row["stopped"]
+    if isinstance(moment, str):
+        moment = parse_timestamp(moment)
+    return moment.date() if moment else None
+
+
+class CsvStorage:
+    """Хранилище по умолчанию: отдельный CSV-файл на аккаунт и groups.csv для разрешённых групп."""
+
+    # Мутации между снимками копятся в файловом журнале <csv>.journal (см. journal.py)
+    journaled = True
+
+    def load_account(self, account: str, day: date | None = None) -> list[dict]:
+        """Строки аккаунта за день day (или все строки, если day=None)."""
+        if not Path(account).exists():
+            logger.info(f"Файл {account} не найден. Начинаем с пустой статистикой.")
+            return []
+        rows = []
+        # Читаем файл построчно: каждая метка времени разбирается один раз,
+        # строки за другие дни отбрасываются до построения записей
+        with open(account, "r", newline="", encoding="utf-8") as f:
+            for raw in csv.DictReader(f):
+                row = {
+                    "started": parse_timestamp(raw.get("started")),
+                    "stopped": parse_timestamp(raw.get("stopped")),
+                }
+                if day is not None and not row_is_on_day(row, day):
+                    continue
+                row.update({
+                    "group_id": int(raw["group_id"]),
+                    "topic_id": int(raw["topic_id"]),
+                    "phone": raw["phone"],
+                    "downtime": float(raw["downtime"]) if raw.get("downtime") else None,
+                    "topic_name": raw.get("topic_name") or None,
+                    "last_phone": raw.get("last_phone") or None,
+                    "group_title": raw.get("group_title") or None,
+                })
+                rows.append(row)
+        return rows
+
+    def save_account(self, account: str, rows: list[dict], day: date) -> None:
+        """Перезаписывает файл аккаунта снимком за день day."""
+        with atomic_open(account, newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDNAMES)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({
+                    **row,
+                    "started": format_timestamp(row["started"]),
+                    "stopped": format_timestamp(row["stopped"]),
+                    "global_message_id": None,
+                })
+
+    def load_allowed_groups(self) -> dict:
+        return load_allowed_groups()
+
+    def save_allowed_groups(self, allowed_groups: dict) -> bool:
+        return save_allowed_groups(allowed_groups)
+
+
+class SqliteStorage:
+    """
+    Хранилище в локальной базе SQLite (режим WAL): сессии, названия тем и групп,
+    последние номера и разрешённые группы. Индексы по (account, group_id, topic_id)
+    и (account, day) позволяют читать и обновлять данные частично.
+    Мутации записей сразу применяются к таблицам (apply_mutations), поэтому файловый
+    журнал в этом режиме не ведётся, а база всегда содержит актуальное состояние.
+    """
+
+    journaled = False
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            account TEXT NOT NULL,
+            day TEXT NOT NULL,
+            group_id INTEGER NOT NULL,
+            topic_id INTEGER NOT NULL,
+            phone TEXT NOT NULL,
+            started TEXT,
+            stopped TEXT,
+            downtime REAL,
+            PRIMARY KEY (account, day, group_id, topic_id, phone)
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_topic ON sessions (account, group_id, topic_id);
+        CREATE INDEX IF NOT EXISTS idx_sessions_day ON sessions (account, day);
+        CREATE TABLE IF NOT EXISTS topic_names (
+            group_id INTEGER NOT NULL,
+            topic_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            PRIMARY KEY (group_id, topic_id)
+        );
+        CREATE TABLE IF NOT EXISTS group_titles (
+            group_id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS last_phones (
+            group_id INTEGER NOT NULL,
+            topic_id INTEGER NOT NULL,
+            phone TEXT NOT NULL,
+            PRIMARY KEY (group_id, topic_id)
+        );
+        CREATE TABLE IF NOT EXISTS allowed_groups (
+            access_key TEXT NOT NULL,
+            group_id INTEGER NOT NULL,
+            group_name TEXT NOT NULL,
+            PRIMARY KEY (access_key, group_id)
+        );
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение на вызов: хранилище используют и цикл событий, и поток записи
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def load_account(self, account: str, day: date | None = None) -> list[dict]:
+        query = """
+            SELECT s.group_id, s.topic_id, s.phone, s.started, s.stopped, s.downtime,
+                   t.name AS topic_name, l.phone AS last_phone, g.title AS group_title
+            FROM sessions s
+            LEFT JOIN topic_names t ON t.group_id = s.group_id AND t.topic_id = s.topic_id
+            LEFT JOIN last_phones l ON l.group_id = s.group_id AND l.topic_id = s.topic_id
+            LEFT JOIN group_titles g ON g.group_id = s.group_id
+            WHERE s.account = ?
+        """
+        params: list = [account]
+        if day is not None:
+            query += " AND s.day = ?"
+            params.append(day.isoformat())
+        with closing(self._connect()) as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [
+            {
+                "group_id": r["group_id"],
+                "topic_id": r["topic_id"],
+                "phone": r["phone"],
+                "started": parse_timestamp(r["started"]),
+                "stopped": parse_timestamp(r["stopped"]),
+                "downtime": r["downtime"],
+                "topic_name": r["topic_name"],
+                "last_phone": r["last_phone"],
+                "group_title": r["group_title"],
+            }
+            for r in rows
+        ]
+
+    def save_account(self, account: str, rows: list[dict], day: date) -> None:
+        """Заменяет сессии аккаунта за день day одной транзакцией, остальные дни не трогает."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM sessions WHERE account = ? AND day = ?", (account, day.isoformat()))
+            conn.executemany(
+                "INSERT OR REPLACE INTO sessions (account, day, group_id, topic_id, phone, started, stopped, downtime) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (account, day.isoformat(), row["group_id"], row["topic_id"], row["phone"],
+                     format_timestamp(row["started"]), format_timestamp(row["stopped"]), row["downtime"])
+                    for row in rows
+                ]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO topic_names (group_id, topic_id, name) VALUES (?, ?, ?)",
+                {(row["group_id"], row["topic_id"], row["topic_name"]) for row in rows if row.get("topic_name")}
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO last_phones (group_id, topic_id, phone) VALUES (?, ?, ?)",
+                {(row["group_id"], row["topic_id"], row["last_phone"]) for row in rows if row.get("last_phone")}
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO group_titles (group_id, title) VALUES (?, ?)",
+                {(row["group_id"], row["group_title"]) for row in rows if row.get("group_title")}
+            )
+
+    def apply_mutations(self, account: str, entries: list[dict], day: date) -> None:
+        """
+        Применяет мутации из буфера журнала (см. BotState.journal_mutation) к сессиям
+        аккаунта за день day одной транзакцией. Каждая мутация несёт полное состояние
+        записи, поэтому применяются они по порядку заменой строки.
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO sessions (account, day, group_id, topic_id, phone, started, stopped, downtime) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (account, day.isoformat(), entry["group_id"], entry["topic_id"], entry["phone"],
+                     entry["started"], entry["stopped"], entry["downtime"])
+                    for entry in entries
+                ]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO topic_names (group_id, topic_id, name) VALUES (?, ?, ?)",
+                [(e["group_id"], e["topic_id"], e["topic_name"]) for e in entries if e.get("topic_name")]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO last_phones (group_id, topic_id, phone) VALUES (?, ?, ?)",
+                [(e["group_id"], e["topic_id"], e["last_phone"]) for e in entries if e.get("last_phone")]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO group_titles (group_id, title) VALUES (?, ?)",
+                [(e["group_id"], e["group_title"]) for e in entries if e.get("group_title")]
+            )
+
+    def load_allowed_groups(self) -> dict:
+        allowed_groups = {}
+        with closing(self._connect()) as conn:
+            for r in conn.execute("SELECT access_key, group_id, group_name FROM allowed_groups"):
+                allowed_groups.setdefault(r["access_key"], {})[r["group_id"]] = r["group_name"]
+        return allowed_groups
+
+    def save_allowed_groups(self, allowed_groups: dict) -> bool:
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("DELETE FROM allowed_groups")
+                conn.executemany(
+                    "INSERT INTO allowed_groups (access_key, group_id, group_name) VALUES (?, ?, ?)",
+                    [(key, group_id, name) for key, groups in allowed_groups.items() for group_id, name in groups.items()]
+                )
+            logger.info("Разрешённые группы успешно сохранены в %s.", self.path)
+            return True
+        except Exception as e:
+            logger.error("Ошибка сохранения разрешённых групп в %s: %s", self.path, e)
+            return False
+
+
+def create_storage(backend: str = STORAGE_BACKEND):
+    if backend == "sqlite":
+        logger.info("Используется хранилище SQLite: %s", SQLITE_PATH)
+        return SqliteStorage(SQLITE_PATH)
+    if backend != "csv":
+        logger.warning("Неизвестное хранилище '%s', используется CSV", backend)
+    return CsvStorage()
+
+
+def import_csv_files(target: SqliteStorage) -> None:
+    """
+    Одноразовый перенос CSV-файлов аккаунтов и groups.csv в базу SQLite. Вместе со снимком
+    переносятся и ещё не свёрнутые в него мутации из журналов <csv>.journal.
+    """
+    source = CsvStorage()
+    for account in ACCESS_KEYS.values():
+        rows = source.load_account(account)
+        by_day: dict[date, list[dict]] = {}
+        for row in rows:
+            row_day = entry_day(row)
+            if row_day is not None:
+                by_day.setdefault(row_day, []).append(row)
+        for row_day, day_rows in by_day.items():
+            target.save_account(account, day_rows, row_day)
+        logger.info("Импортировано из %s строк: %s", account, sum(len(r) for r in by_day.values()))
+        entries_by_day: dict[date, list[dict]] = {}
+        for entry in get_journal(account).read():
+            row_day = entry_day(entry)
+            if row_day is not None:
+                entries_by_day.setdefault(row_day, []).append(entry)
+        for row_day, day_entries in entries_by_day.items():
+            target.apply_mutations(account, day_entries, row_day)
+        if entries_by_day:
+            logger.info("Импортировано из журнала %s мутаций: %s", account, sum(len(e) for e in entries_by_day.values()))
+    allowed_groups = source.load_allowed_groups()
+    if allowed_groups:
+        target.save_allowed_groups(allowed_groups)
+
+
+storage = create_storage()
+
+
+if __name__ == "__main__":
+    # python storage.py import-csv — перенести существующие CSV в SQLITE_PATH
+    if sys.argv[1:] == ["import-csv"]:
+        logging.basicConfig(level=logging.INFO)
+        import_csv_files(SqliteStorage(SQLITE_PATH))
+    else:
+        print("Использование: python storage.py import-csv")
@@ -0,0 +1,110 @@
+import json
+
+from relevance_filter import BASE_CHATTER_WORDS, evaluate, is_relevant, learn_chatter, load_labelled_log
+
+# Размеченный корпус: (сообщение, описывает ли оно событие или номер по ответу LLM)
+LABELLED_CORPUS = [
+    ("встал", True),
+    ("Встал 1122", True),
+    ("встала в 12:00", True),
+    ("вслат", True),
+    ("вствл 13.40", True),
+    ("стлоит", True),
+    ("сашел", True),
+    ("вхлд", True),
+    ("vstal", True),
+    ("zashel 1200", True),
+    ("работает", True),
+    ("работает?", True),
+    ("зашёл", True),
+    ("слетел", True),
+    ("слетела", True),
+    ("Слетел(", True),
+    ("слтеел", True),
+    ("стел", True),
+    ("стелел", True),
+    ("slet", True),
+    ("sletel", True),
+    ("умер", True),
+    ("умерла", True),
+    ("сдох", True),
+    ("#СЛЕТ", True),
+    ("#слёт 12.40", True),
+    ("слет можно новый?", True),
+    ("минус?", True),
+    ("+ 1150 - 1155", True),
+    ("+", True),
+    ("-", True),
+    ("+79954885859", True),
+    ("7 995 488-58-59", True),
+    ("id: 2 встал", True),
+    ("встал - 21:00", True),
+    ("встал и сразу слетел", True),
+    ("начал грузить и вылет", True),
+    ("номер вылетел", True),
+    # Формулировки вне словаря событий: фильтр не должен их отбрасывать
+    ("упал", True),
+    ("номер отвалился", True),
+    ("забанили", True),
+    ("поставил", True),
+    ("запустил", True),
+    ("отлетел", True),
+    ("сломался", True),
+    ("всё, кончился", True),
+    ("привет", False),
+    ("Всем привет!", False),
+    ("доброе утро", False),
+    ("спасибо", False),
+    ("ок", False),
+    ("понял, принял", False),
+    ("кто сегодня на смене?", False),
+    ("когда будет оплата?", False),
+    ("скиньте номер пожалуйста", False),
+    ("ошибка", False),
+    ("новый", False),
+    ("жду", False),
+    ("хорошо, сейчас посмотрю", False),
+    ("ахахах", False),
+    ("👍", False),
+    ("ладно", False),
+    ("всё понятно", False),
+    ("у меня не грузит", False),
+]
+
+
+def test_corpus_keeps_every_event():
+    result = evaluate(LABELLED_CORPUS, BASE_CHATTER_WORDS)
+    assert result["missed"] == []
+
+
+def test_corpus_drops_known_chatter():
+    result = evaluate(LABELLED_CORPUS, BASE_CHATTER_WORDS)
+    assert result["kept_chatter"] == []
+
+
+def test_unknown_words_are_relevant():
+    # Незнакомое слово может быть новой формулировкой события — решает LLM
+    assert is_relevant("фыва олдж", BASE_CHATTER_WORDS)
+
+
+def write_log(path, entries):
+    with open(path, "w", encoding="utf-8") as f:
+        for text, started, stopped, phone in entries:
+            f.write(json.dumps({"text": text, "started": started, "stopped": stopped, "phone": phone}, ensure_ascii=False) + "\n")
+
+
+def test_learned_chatter_never_contains_event_words(tmp_path):
+    path = tmp_path / "extractions.jsonl"
+    write_log(path, [
+        ("го на обед", False, False, False),
+        ("го на обед", False, False, False),
+        ("го на обед", False, False, False),
+        ("обед", False, False, False),
+        ("го, номер отвалился", False, True, False),
+    ])
+    samples = load_labelled_log(str(path))
+    learned = learn_chatter(samples)
+    assert learned == {"на", "обед"}
+    chatter = BASE_CHATTER_WORDS | learned
+    assert not is_relevant("на обед", chatter)
+    assert evaluate(samples, chatter)["missed"] == []
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def ordering_key(update: object) -> tuple:
+    """
+    Ключ очереди обновления: (group_id, topic_id) для сообщений групп — так же, как в message_handler,
+    и (chat_id, chat_id) для личных чатов, команд и кнопок.
+    """
+    if not isinstance(update, Update) or update.effective_chat is None:
+        return ("global",)
+    chat_id = update.effective_chat.id
+    message = update.effective_message
+    if message is not None and message.message_thread_id is not None:
+        return (chat_id, message.message_thread_id)
+    return (chat_id, chat_id)
+
+
+class TopicOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка обновлений с сохранением порядка внутри темы.
+    Обновления разных тем (group_id, topic_id) обрабатываются одновременно, не более max_workers сразу,
+    а обновления одной темы — строго по очереди: номер телефона всегда обработается раньше "встал",
+    который опирается на state.last_phone. Всего в обработке и в очередях не больше queue_size обновлений,
+    остальные ждут в очереди приложения.
+    """
+
+    __slots__ = ("_max_workers", "_workers", "_tails")
+
+    def __init__(self, max_workers: int, queue_size: int):
+        super().__init__(max(queue_size, max_workers))
+        self._max_workers = max_workers
+        self._workers: asyncio.Semaphore | None = None
+        # Ключ темы -> future последнего поставленного в очередь обновления этой темы
+        self._tails: dict[tuple, asyncio.Future] = {}
+
+    async def initialize(self) -> None:
+        self._workers = asyncio.Semaphore(self._max_workers)
+        logger.info(
+            "Параллельная обработка обновлений: обработчиков %s, размер очереди %s",
+            self._max_workers, self.max_concurrent_updates
+        )
+
+    async def shutdown(self) -> None:
+        self._tails.clear()
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        key = ordering_key(update)
+        # Место в очереди темы занимаем до первого await, поэтому порядок совпадает с порядком получения
+        previous = self._tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[key] = done
+        try:
+            if previous is not None:
+                # shield: отмена этого обновления не должна отменять ожидание предыдущего
+                await asyncio.shield(previous)
+            async with self._workers:
+                await coroutine
+        finally:
+            done.set_result(None)
+            if self._tails.get(key) is done:
+                del self._tails[key]
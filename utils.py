@@ -2,14 +2,12 @@
 import re
 import json
 import logging
-from google import genai
-from config import GEMINI_API_KEY, GEMINI_MODEL, GEMINI_API_KEY_SECONDARY
+from google.genai import types
 
 logger = logging.getLogger(__name__)
 
-def extract_event_info(text: str, default_topic_id: int, message_sent_time) -> dict:
-    prompt = (
-
+# Правила извлечения, общие для одиночного и пакетного запроса
+EXTRACTION_RULES_HEAD = (
         """
         You are a text analysis assistant. Extract the data and output only JSON.
         A text in Russian language and Message sending time in the format 2025-02-27 17:56:02+02:00 will be provided.
@@ -28,12 +26,22 @@ def extract_event_info(text: str, default_topic_id: int, message_sent_time) -> d
     
         Additional notes: 
         1. If there are simply 4 digits, e.g., 'встал 1122', recognize this as time 11:22. There may be messages with both events specified, e.g., '+ 1150 - 1155', which should be recognized as two events: started 11:50 and stopped 11:55.
-        2. Return only one JSON for the number. If there is no number but there are entry and exit times, return the times for an empty number with started true and stopped true.
-        After creating the JSON, double-check to ensure there is only one entry for one phone, even if it is none.
-        3. the message can be like 'встал - 21:00' this should be interpreted as started time 21:00, and NOT as stopped time
+"""
+)
+EXTRACTION_RULES_TAIL = (
+        """        3. the message can be like 'встал - 21:00' this should be interpreted as started time 21:00, and NOT as stopped time
         4. the message can be like 'начал грузить и вылет' or 'встал и сразу слетел' should be recognized as started: false stopped: false
         
-        Example of a correct response:
+"""
+)
+# Только для одиночного запроса: ответ одним объектом и примеры такого ответа
+SINGLE_ANSWER_NOTE = (
+        """        2. Return only one JSON for the number. If there is no number but there are entry and exit times, return the times for an empty number with started true and stopped true.
+        After creating the JSON, double-check to ensure there is only one entry for one phone, even if it is none.
+"""
+)
+SINGLE_ANSWER_EXAMPLES = (
+        """        Example of a correct response:
         {"phone": "79954885859", "started": true, "stopped": true, "started_time": "12:30", "stopped_time": "12:40", "topic_id": 2}
         
         Example of an INCORRECT response (do not send multiple entries):
@@ -66,47 +74,147 @@ def extract_event_info(text: str, default_topic_id: int, message_sent_time) -> d
                 "topic_id": None
             }
         """
+)
+EXTRACTION_PROMPT = EXTRACTION_RULES_HEAD + SINGLE_ANSWER_NOTE + EXTRACTION_RULES_TAIL + SINGLE_ANSWER_EXAMPLES
+
+def build_prompt(text: str, message_sent_time) -> str:
+    return EXTRACTION_PROMPT + f"\nТекст: " + text + f"\nВремя отправки сообщения: {message_sent_time}"
+
+def parse_llm_output(output_text: str) -> dict:
+    output_text = output_text.strip()
+    json_match = re.search(r'\{.*\}', output_text, re.DOTALL)
+    if json_match:
+        output_text = json_match.group(0)
+    output_text = output_text.replace('```json', '').replace('```', '').strip()
+    logger.info(f"Очищенный ответ Gemini: {output_text}")
+    return json.loads(output_text)
+
+BATCH_INSTRUCTION = (
+    """
+        Below are several independent messages, each numbered with "Сообщение N".
+        Apply all the rules above to every message separately and return a JSON array
+        with exactly one object per message, even if a message has no phone or no events.
+        If a message has no number but has entry and exit times, its object has phone null
+        with started true and stopped true. Every object must contain the field "index"
+        equal to the number N of the message it describes, plus the fields described above.
+
+        Example of a correct response for two messages:
+        [{"index": 0, "phone": "79954885859", "started": true, "stopped": false, "started_time": "12:30", "stopped_time": "12:30", "topic_id": null},
+         {"index": 1, "phone": null, "started": true, "stopped": true, "started_time": "11:50", "stopped_time": "11:55", "topic_id": 2}]
+        """
+)
+
+def build_batch_prompt(items: list[tuple[str, object]]) -> str:
+    """Один запрос на пакет сообщений: общая инструкция и пронумерованные тексты."""
+    # Без требования единственного объекта из одиночной подсказки — оно противоречит ответу массивом
+    parts = [EXTRACTION_RULES_HEAD, EXTRACTION_RULES_TAIL, BATCH_INSTRUCTION]
+    for index, (text, message_sent_time) in enumerate(items):
+        parts.append(f"\nСообщение {index}:\nТекст: {text}\nВремя отправки сообщения: {message_sent_time}")
+    return "".join(parts)
+
+def parse_llm_batch_output(output_text: str) -> dict[int, dict]:
+    """Разбирает JSON-массив пакетного ответа в словарь index -> объект."""
+    output_text = output_text.replace('```json', '').replace('```', '').strip()
+    array_match = re.search(r'\[.*\]', output_text, re.DOTALL)
+    if array_match:
+        output_text = array_match.group(0)
+    logger.info(f"Очищенный пакетный ответ Gemini: {output_text}")
+    items = json.loads(output_text)
+    return {int(item.pop("index")): item for item in items if isinstance(item, dict) and "index" in item}
+
+# Режим структурированного ответа: статические правила передаются как system instruction,
+# формат ответа задаёт схема, а в каждом запросе остаются только текст и время отправки
+STRUCTURED_SYSTEM_INSTRUCTION = (
+    """
+    Extract an event about a phone number from a Russian chat message. The user sends the message text and its sending time.
+    phone: the phone number from the message without + and separators (a bare number means the phone), otherwise null.
+    started: true if the message says the number started working ('встал', 'работает', 'зашел', '+ time'; a bare '+' is false), including typos and transliteration ('вслат', 'стлоит', 'сашел', 'вхлд', 'vstal', 'zashel'). False for questions like 'встал?', 'работает?'.
+    stopped: true if the message says the number stopped working ('слетел', 'умер', '- time', '#СЛЕТ'; a bare '-' is false), including typos and transliteration ('стел', 'стелел', 'slet', 'sletel'). False for questions like 'слет?', 'минус?', but 'слет можно новый?' is true.
+    started_time, stopped_time: the HH:MM time written after the event, accepting typos like '1200', '12^00', '12.00', '12/00', '12 00'; otherwise the sending time as HH:MM.
+    topic_id: N if the text contains 'id: N', otherwise null.
+    '+ 1150 - 1155' means started 11:50 and stopped 11:55. 'встал - 21:00' means started 21:00, not stopped.
+    'начал грузить и вылет' and 'встал и сразу слетел' mean started false and stopped false.
+    Return a single object for the message.
+    """
+)
+BATCH_SYSTEM_INSTRUCTION = STRUCTURED_SYSTEM_INSTRUCTION + (
+    """
+    The user sends several independent messages as JSON lines with "index", "time" and "text".
+    Return one object per message, with "index" equal to the index of the message it describes.
+    """
+)
+
+EXTRACTION_SCHEMA = types.Schema(
+    type=types.Type.OBJECT,
+    properties={
+        "phone": types.Schema(type=types.Type.STRING, nullable=True),
+        "started": types.Schema(type=types.Type.BOOLEAN),
+        "stopped": types.Schema(type=types.Type.BOOLEAN),
+        "started_time": types.Schema(type=types.Type.STRING, nullable=True),
+        "stopped_time": types.Schema(type=types.Type.STRING, nullable=True),
+        "topic_id": types.Schema(type=types.Type.INTEGER, nullable=True),
+    },
+    required=["phone", "started", "stopped", "started_time", "stopped_time", "topic_id"],
+)
+BATCH_EXTRACTION_SCHEMA = types.Schema(
+    type=types.Type.ARRAY,
+    items=types.Schema(
+        type=types.Type.OBJECT,
+        properties={"index": types.Schema(type=types.Type.INTEGER), **EXTRACTION_SCHEMA.properties},
+        required=["index", *EXTRACTION_SCHEMA.required],
+    ),
+)
+
+def build_compact_content(text: str, message_sent_time) -> str:
+    return f"{message_sent_time}\n{text}"
+
+def build_compact_batch_content(items: list[tuple[str, object]]) -> str:
+    return "\n".join(
+        json.dumps({"index": index, "time": str(message_sent_time), "text": text}, ensure_ascii=False)
+        for index, (text, message_sent_time) in enumerate(items)
+    )
+
+def parse_structured_output(output_text: str) -> dict:
+    """Ответ в режиме схемы — уже чистый JSON-объект."""
+    extracted = json.loads(output_text)
+    if isinstance(extracted, list):
+        extracted = extracted[0]
+    return extracted
+
+def parse_structured_batch_output(output_text: str) -> dict[int, dict]:
+    items = json.loads(output_text)
+    return {int(item.pop("index")): item for item in items if isinstance(item, dict) and "index" in item}
+
+def normalize_extraction(extracted: dict, text: str) -> dict:
+    """
+    Приводит ответ LLM к единому виду, не зависящему от времени отправки:
+    номер без разделителей, булевы started/stopped, topic_id только если он явно указан.
+    """
+    if extracted.get("phone"):
+        extracted["phone"] = re.sub(r'[^\d+]', '', str(extracted["phone"])).lstrip('+')
+    topic_id_match = re.search(r'id:\s*(\d+)', text)
+    extracted["topic_id"] = extracted.get("topic_id") or (int(topic_id_match.group(1)) if topic_id_match else None)
+    # Гарантируем, что значения started и stopped – булевы
+    extracted["started"] = bool(extracted.get("started"))
+    extracted["stopped"] = bool(extracted.get("stopped"))
+    extracted.setdefault("started_time", None)
+    extracted.setdefault("stopped_time", None)
+    return extracted
+
+def finalize_extraction(extracted: dict, default_topic_id: int, message_sent_time) -> dict:
+    """Подставляет тему по умолчанию и корректирует времена относительно времени отправки."""
+    result = dict(extracted)
+    result["topic_id"] = result.get("topic_id") or default_topic_id
+    result["started_time"], result["stopped_time"] = adjust_times(
+        result["started"],
+        result["stopped"],
+        result.get("started_time"),
+        result.get("stopped_time"),
+        message_sent_time
     )
-    full_prompt = prompt + f"\nТекст: " + text + f"\nВремя отправки сообщения: {message_sent_time}"
-    logger.info(f"Сообщение для LLM: {text} {message_sent_time}")
-    # Список ключей для попытки использования
-    gemini_keys = [GEMINI_API_KEY, GEMINI_API_KEY_SECONDARY]
-    for key in gemini_keys:
-        try:
-            client = genai.Client(api_key=key)
-            response = client.models.generate_content(model=GEMINI_MODEL, contents=full_prompt)
-            output_text = response.text.strip()
-            json_match = re.search(r'\{.*\}', output_text, re.DOTALL)
-            if json_match:
-                output_text = json_match.group(0)
-            output_text = output_text.replace('```json', '').replace('```', '').strip()
-            logger.info(f"Очищенный ответ Gemini: {output_text}")
-            extracted = json.loads(output_text)
-            if extracted.get("phone"):
-                extracted["phone"] = re.sub(r'[^\d+]', '', extracted["phone"]).lstrip('+')
-            topic_id_match = re.search(r'id:\s*(\d+)', text)
-            extracted["topic_id"] = extracted.get("topic_id") or (int(topic_id_match.group(1)) if topic_id_match else default_topic_id)
-            # Гарантируем, что значения started и stopped – булевы
-            extracted["started"] = bool(extracted.get("started"))
-            extracted["stopped"] = bool(extracted.get("stopped"))
-            new_started, new_stopped = adjust_times(
-                extracted["started"],
-                extracted["stopped"],
-                extracted["started_time"],
-                extracted["stopped_time"],
-                message_sent_time
-            )
-
-            extracted["started_time"] = new_started
-            extracted["stopped_time"] = new_stopped
-            return extracted
-        except Exception as e:
-            err_msg = str(e).lower()
-            logger.error(f"Ошибка при запросе с ключом {key}: {e}")
-            logger.info(f"Попытка использовать следующий Gemini API ключ вместо {key}")
-            continue
-
-    # Если ни один ключ не сработал, возвращаем значения по умолчанию
+    return result
+
+def empty_extraction(default_topic_id: int) -> dict:
     return {
         "phone": None,
         "started": False,
@@ -1,39 +1,44 @@
+import asyncio
 import logging
-from datetime import datetime
-import pytz
+import os
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Iterable, TypeVar
+
+T = TypeVar("T")
 
 logger = logging.getLogger(__name__)
 
-def ensure_datetime(value):
-    logger.debug("Проверка и преобразование значения '%s' в datetime", value)
-    if isinstance(value, str):
-        try:
-            dt = datetime.strptime(value, "%H:%M")
-            logger.debug("Строка '%s' успешно преобразована в datetime: %s", value, dt)
-            return dt
-        except ValueError:
-            logger.error("Ошибка преобразования строки '%s' в datetime", value)
-            return None
-    elif isinstance(value, datetime):
-        logger.debug("Значение уже является datetime: %s", value)
-        return value
-    logger.warning("Неподдерживаемый тип для преобразования в datetime: %s", type(value))
-    return None
+@contextmanager
+def atomic_open(path, newline=None):
+    """
+    Открывает временный файл рядом с path для записи и по завершении атомарно
+    подменяет им path, чтобы при сбое на диске не оставался недописанный файл.
+    """
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8", newline=newline) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+async def fan_out(items: Iterable[T], deliver: Callable[[T], Awaitable[None]], limit: int, label: str = "доставки") -> None:
+    """
+    Выполняет deliver для всех items параллельно, не больше limit одновременно.
+    Ошибка одного элемента логируется и не прерывает остальные.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(item: T) -> None:
+        async with semaphore:
+            try:
+                await deliver(item)
+            except Exception as e:
+                logger.error("Ошибка %s для %s: %s", label, item, e)
 
-def convert_to_datetime(value):
-    logger.debug("Преобразование значения '%s' в datetime с учетом часового пояса Europe/Kiev", value)
-    if isinstance(value, str):
-        try:
-            time_part = datetime.strptime(value, "%H:%M").time()
-            now = datetime.now(pytz.timezone("Europe/Kiev"))
-            dt = datetime.combine(now.date(), time_part)
-            logger.debug("Преобразование успешно: %s", dt)
-            return dt
-        except ValueError:
-            logger.error("Ошибка преобразования строки '%s' в datetime", value)
-            return None
-    elif isinstance(value, datetime):
-        logger.debug("Значение уже является datetime: %s", value)
-        return value
-    logger.warning("Неподдерживаемый тип для преобразования: %s", type(value))
-    return None
+    await asyncio.gather(*(run(item) for item in items))
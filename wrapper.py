@@ -4,6 +4,7 @@ from telegram import Update
 from telegram.ext import CallbackContext
 logger = logging.getLogger(__name__)
 
+from outbound import reply
 from state import state  # импорт глобального состояния
 
 def require_auth(func):
@@ -14,7 +15,7 @@ def require_auth(func):
         if chat_type == "private":
             if not context.user_data.get("access_key"):
                 if update.message:
-                    await update.message.reply_text("Вы не авторизованы. Пожалуйста, используйте /start для авторизации.")
+                    await reply(update, context, "Вы не авторизованы. Пожалуйста, используйте /start для авторизации.")
                 elif update.callback_query:
                     await update.callback_query.answer("Вы не авторизованы. Пожалуйста, используйте /start для авторизации.", show_alert=True)
                 return